@@ -1,10 +1,29 @@
 import datetime
-import re
-from collections import defaultdict
+from functools import partial
+from operator import itemgetter
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from disciplines import (
+    DEFAULT_DISCIPLINE,
+    METRIC_COLUMNS,
+    discipline_metrics,
+    partition_by_discipline,
+    partition_fingerprint,
+)
+from parallel_build import (
+    accumulate_in_processes,
+    build_mode,
+    get_build_executor,
+)
+from pipeline import Pipeline
+from records import update_records_index
+from report_bundle import get_report_bundle_builder
+from schema import UnsupportedExportError, normalize_workouts_df
+from sketch import KLLSketch
+
 
 def datetime_to_day_index(datetime_obj):
     return datetime_obj.date()
@@ -25,57 +44,555 @@ def datetime_to_year_index(datetime_obj):
     return datetime_obj.year
 
 
-def process_workouts_df():
+# Each aggregation's group-by column and, for time buckets, the function mapping a
+# day to its bucket. Time buckets are stored sparsely (only buckets with rides) and
+# the function is used to densify them for a chart window or an export.
+AGGREGATIONS = {
+    "all_time": (None, None),
+    "by_year": ("c_year", datetime_to_year_index),
+    "by_month": ("c_month", datetime_to_month_index),
+    "by_week": ("c_week", datetime_to_week_index),
+    "by_day": ("c_day", datetime_to_day_index),
+    "by_instructor": ("Instructor Name", None),
+    "by_class_type": ("Type", None),
+    "by_class_length": ("Length (minutes)", None),
+}
+
+# Per-workout values summarized by the quantile sketches of each group
+SKETCH_METRICS = {
+    "Output (watts)": lambda df: (100.0 / 6.0) * df["Total Output"] / df["c_duration"],
+    "Cadence (RPM)": lambda df: df["Avg. Cadence (RPM)"],
+    "Resistance (%)": lambda df: df["Avg. Resistance"],
+    "Heartrate": lambda df: df["Avg. Heartrate"],
+}
+SKETCH_QUANTILES = {"p10": 0.1, "p50": 0.5, "p90": 0.9}
+# The export column each sketch metric is derived from
+SKETCH_METRIC_SOURCES = {
+    "Output (watts)": "Total Output",
+    "Cadence (RPM)": "Avg. Cadence (RPM)",
+    "Resistance (%)": "Avg. Resistance",
+    "Heartrate": "Avg. Heartrate",
+}
+
+# The accumulator holding each metric, and whether it is averaged per minute (so is
+# weighted by workout length) or summed as is
+WEIGHTED_METRICS = {
+    "Total Output": ("total_output", False),
+    "Calories Burned": ("total_calories", False),
+    "Avg. Heartrate": ("total_hr", True),
+    "Avg. Speed (mph)": ("total_speed", True),
+    "Avg. Cadence (RPM)": ("total_cadence", True),
+    "Avg. Resistance": ("total_resistance", True),
+}
+
+# Each aggregated column with the accumulator it needs, in display order. Columns
+# whose accumulator was not built for a discipline are left out.
+AGGREGATED_COLUMNS = [
+    ("Total Workouts", "total_workouts", lambda a: a["total_workouts"]),
+    ("Total Minutes", "total_time", lambda a: a["total_time"]),
+    ("Total Distance", "total_distance", lambda a: a["total_distance"]),
+    ("Total Output", "total_output", lambda a: a["total_output"]),
+    ("Total Calories", "total_calories", lambda a: a["total_calories"]),
+    (
+        "Avg. Output (watts)",
+        "total_output",
+        lambda a: (100.0 / 6.0) * a["total_output"] / a["total_output_minutes"],
+    ),
+    (
+        "Avg. Output (kj/m)",
+        "total_output",
+        lambda a: a["total_output"] / a["total_output_minutes"],
+    ),
+    (
+        "Avg. Calories per Minute",
+        "total_calories",
+        lambda a: a["total_calories"] / a["total_calories_minutes"],
+    ),
+    ("Avg. Heartrate", "total_hr", lambda a: a["total_hr"] / a["total_hr_minutes"]),
+    (
+        "Avg. Speed (mph)",
+        "total_speed",
+        lambda a: a["total_speed"] / a["total_speed_minutes"],
+    ),
+    (
+        "Avg. Cadence (RPM)",
+        "total_cadence",
+        lambda a: a["total_cadence"] / a["total_cadence_minutes"],
+    ),
+    (
+        "Avg. Resistance",
+        "total_resistance",
+        lambda a: a["total_resistance"] / a["total_resistance_minutes"],
+    ),
+]
+
+# Stand-ins for missing keys in the activity cube, e.g. scenic rides
+NO_INSTRUCTOR = "No Instructor"
+NO_CLASS_TYPE = "No Class Type"
+
+
+def parse_timestamps(timestamps, utc):
+    # Parse a whole column at once, falling back to one parse per distinct value for
+    # formats the vectorized parser rejects
+    try:
+        return pd.to_datetime(timestamps, utc=utc)
+    except (ValueError, TypeError):
+        pass
+    parsed = {}
+    for value in timestamps.unique():
+        try:
+            parsed[value] = pd.to_datetime(value)
+        except (ValueError, TypeError, OverflowError):
+            # Reject the export like any other unreadable file, before anything
+            # half-parsed reaches the session
+            raise UnsupportedExportError(
+                "Could not read the Workout Timestamp {!r}".format(value)
+            )
+    try:
+        return pd.to_datetime(timestamps.map(parsed), utc=utc)
+    except (ValueError, TypeError) as e:
+        raise UnsupportedExportError(
+            "Could not read the Workout Timestamp column: {}".format(e)
+        )
+
+
+def parse_workouts_df(raw_workouts_df):
+    workouts_df = raw_workouts_df.copy()
+    timestamps = workouts_df["Workout Timestamp"].astype(str)
+
+    # Replace (-05) with -05:00 and (+01) with +01:00 for the absolute time. The
+    # local time is the wall-clock part in front of the offset.
+    workouts_df["c_datetime"] = parse_timestamps(
+        timestamps.str.replace(r"\(([+-])(\d\d)\)", r"\1\2:00", regex=True),
+        utc=True,
+    )
+    local_datetime = parse_timestamps(
+        timestamps.str.replace(r"\s*\([^)]*\)\s*$", "", regex=True), utc=False
+    )
+
+    # Derive every time bucket in one vectorized pass. Weeks go through the
+    # original index function once per distinct day rather than once per row.
+    days = local_datetime.dt.date
+    workouts_df["c_day"] = days
+    workouts_df["c_week"] = days.map(
+        {day: datetime_to_week_index(day) for day in days.unique()}
+    )
+    workouts_df["c_month"] = local_datetime.dt.strftime("%Y-%m")
+    workouts_df["c_year"] = local_datetime.dt.year
+    workouts_df["c_weekday"] = local_datetime.dt.dayofweek
+    workouts_df["c_hour"] = local_datetime.dt.hour
+    return workouts_df
+
+
+def bucket_keys(index_function, start, end):
+    # Every time bucket touched by the days from start to end, in order
+    return pd.Index([index_function(day) for day in pd.date_range(start, end)]).unique()
+
+
+def workouts_day_span(workouts_df):
+    return (workouts_df["c_day"].min(), workouts_df["c_day"].max())
+
+
+def summarize_workouts(workouts_df, all_time_aggregation, instructor_aggregation):
+    # Totals a discipline doesn't track are left out of the summary
+    all_time_df = all_time_aggregation.aggregated_df
+    summary = {
+        "n_workouts": all_time_df["Total Workouts"].sum(),
+        "n_instructors": len(instructor_aggregation.aggregated_df),
+        "n_live": int((workouts_df["Live/On-Demand"] == "Live").sum()),
+        "n_on_demand": int((workouts_df["Live/On-Demand"] == "On Demand").sum()),
+        "total_minutes": all_time_df["Total Minutes"].sum(),
+    }
+    for key, column, reduce in [
+        ("total_distance", "Total Distance", "sum"),
+        ("avg_speed", "Avg. Speed (mph)", "mean"),
+        ("total_output", "Total Output", "sum"),
+        ("total_calories", "Total Calories", "sum"),
+    ]:
+        if column in all_time_df:
+            summary[key] = getattr(all_time_df[column], reduce)()
+    return summary
+
+
+def build_export_pipeline():
+    # raw export -> canonical units -> parsed columns -> one frame per discipline.
+    # Each discipline then gets its own pipeline from build_workouts_pipeline, so
+    # switching discipline never re-reads or re-parses the export.
+    pipeline = Pipeline()
+    pipeline.add_node(
+        "normalized_workouts_df", normalize_workouts_df, ["raw_workouts_df"]
+    )
+    pipeline.add_node(
+        "parsed_workouts_df", parse_workouts_df, ["normalized_workouts_df"]
+    )
+    pipeline.add_node("partitions", partition_by_discipline, ["parsed_workouts_df"])
+    return pipeline
+
+
+def build_workouts_pipeline(discipline=DEFAULT_DISCIPLINE, mode=None, workers=None):
+    # One discipline's parsed workouts (the "workouts_df" input) -> accumulators ->
+    # aggregated frames -> styled tables. Only the discipline's metrics are
+    # accumulated. The render modules hang their figures off the aggregation nodes.
+    mode = mode or build_mode()
+    metrics = discipline_metrics(discipline)
+    pipeline = Pipeline()
+    pipeline.add_node("day_span", workouts_day_span, ["workouts_df"])
+
+    if mode == "process":
+        # Every aggregation's accumulators come from one fan-out over worker
+        # processes that read the columns from shared memory
+        pipeline.add_node(
+            "accumulators",
+            partial(
+                _accumulate_in_processes,
+                group_bys={name: spec[0] for name, spec in AGGREGATIONS.items()},
+                metrics=metrics,
+                workers=workers,
+            ),
+            ["workouts_df"],
+        )
+
+    for name, (group_by, index_function) in AGGREGATIONS.items():
+        if mode == "process":
+            pipeline.add_node(
+                "accumulators/" + name, itemgetter(name), ["accumulators"]
+            )
+        else:
+            pipeline.add_node(
+                "accumulators/" + name,
+                partial(accumulate, group_by=group_by, metrics=metrics),
+                ["workouts_df"],
+            )
+        pipeline.add_node(
+            "aggregation/" + name,
+            partial(
+                Aggregation.from_accumulators,
+                group_by=group_by,
+                index_function=index_function,
+            ),
+            ["accumulators/" + name, "day_span"],
+        )
+        pipeline.add_node(
+            "styled/" + name,
+            lambda aggregation: style_aggregated_df(aggregation.aggregated_df),
+            ["aggregation/" + name],
+        )
+        pipeline.add_node(
+            "sketches/" + name,
+            partial(build_sketches, group_by=group_by, metrics=metrics),
+            ["workouts_df"],
+        )
+        pipeline.add_node(
+            "quantiles/" + name,
+            partial(build_quantiles, group_by=group_by, metrics=metrics),
+            ["workouts_df"],
+        )
+
+    pipeline.add_node(
+        "activity_cube", partial(build_activity_cube, metrics=metrics), ["workouts_df"]
+    )
+    pipeline.add_node(
+        "records", update_records_index, ["workouts_df"], incremental=True
+    )
+    pipeline.add_node(
+        "summary",
+        summarize_workouts,
+        ["workouts_df", "aggregation/all_time", "aggregation/by_instructor"],
+    )
+    return pipeline
+
+
+def process_workouts_df(fingerprint=None):
     # Bail out if we don't have a workouts_df on the session_state
     if "workouts_df" not in st.session_state:
         return
-    workouts_df = st.session_state["workouts_df"]
 
-    # Convert to datetime
-    def parse_datetime(date_str):
-        # Replace (-05) with -05:00 and (+5) with +05:00 using regex
-        date_str = re.sub(r"\(-0(\d)\)", r"-0\1:00", date_str)
-        date_str = re.sub(r"\(+0(\d)\)", r"+0\1:00", date_str)
+    export_pipeline = st.session_state.get("export_pipeline", None)
+    if export_pipeline is None:
+        export_pipeline = build_export_pipeline()
+        st.session_state["export_pipeline"] = export_pipeline
 
-        return pd.to_datetime(date_str)
+    # Only artifacts whose inputs changed are rebuilt; an identical upload is a no-op.
+    # The caller may pass the upload's fingerprint to save hashing the frame.
+    export_pipeline.set_input(
+        "raw_workouts_df", st.session_state["workouts_df"], fingerprint=fingerprint
+    )
+    partitions = export_pipeline.get("partitions")
+    if not partitions:
+        # A header-only export has nothing to select; let the caller reject it
+        raise UnsupportedExportError("No workouts found")
+    st.session_state["workouts_partitions"] = partitions
+
+    # Pipelines for disciplines that aren't in this export are dropped
+    pipelines = st.session_state.get("discipline_pipelines", {})
+    st.session_state["discipline_pipelines"] = {
+        discipline: pipeline
+        for discipline, pipeline in pipelines.items()
+        if discipline in partitions
+    }
+    select_discipline(st.session_state.get("discipline", DEFAULT_DISCIPLINE))
+
+
+def select_discipline(discipline):
+    # Point the session at one discipline's partition and pipeline, building the
+    # pipeline on first use. The partition is already parsed, so this is a lookup.
+    partitions = st.session_state.get("workouts_partitions", None)
+    if not partitions:
+        return
+    if discipline not in partitions:
+        discipline = next(iter(partitions))
 
-    # Parse the various versions of the Workout's Timestamp
-    workouts_df["c_datetime"] = workouts_df["Workout Timestamp"].apply(
-        lambda x: parse_datetime(x)
+    pipelines = st.session_state.setdefault("discipline_pipelines", {})
+    pipeline, changed = load_discipline(
+        st.session_state["export_pipeline"], pipelines, discipline
     )
-    workouts_df["c_day"] = workouts_df["c_datetime"].apply(datetime_to_day_index)
-    workouts_df["c_week"] = workouts_df["c_datetime"].apply(datetime_to_week_index)
-    workouts_df["c_month"] = workouts_df["c_datetime"].apply(datetime_to_month_index)
-    workouts_df["c_year"] = workouts_df["c_datetime"].apply(datetime_to_year_index)
-    workouts_df["c_datetime"] = pd.to_datetime(workouts_df["c_datetime"], utc=True)
+    st.session_state["discipline"] = discipline
+    st.session_state["workouts_pipeline"] = pipeline
+    st.session_state["workouts_df"] = partitions[discipline]
+    if not changed:
+        return
 
-    date_range = pd.Series(
-        pd.date_range(start=workouts_df["c_day"].min(), end=workouts_df["c_day"].max())
+    aggregations = build_aggregations(pipeline)
+    # Start packaging the download now so it is ready by the time anyone asks
+    get_report_bundle_builder().submit(
+        pipeline.fingerprint("workouts_df"), aggregations
     )
 
-    # After processing, reassign the processed DF to session_state
-    st.session_state["workouts_df"] = workouts_df
-    st.session_state["workouts_aggregation_all_time"] = Aggregation(workouts_df)
-    st.session_state["workouts_aggregation_by_year"] = Aggregation(
-        workouts_df, "c_year", extra_indices=date_range.apply(datetime_to_year_index)
+
+def load_discipline(export_pipeline, pipelines, discipline):
+    # The pipeline of one discipline's partition, created on first use and pointed
+    # at the current export. Also returns whether its input changed.
+    pipeline = pipelines.get(discipline, None)
+    if pipeline is None:
+        pipeline = build_workouts_pipeline(discipline)
+        pipelines[discipline] = pipeline
+
+    fingerprint = partition_fingerprint(
+        export_pipeline.fingerprint("partitions"), discipline
     )
-    st.session_state["workouts_aggregation_by_month"] = Aggregation(
-        workouts_df, "c_month", extra_indices=date_range.apply(datetime_to_month_index)
+    if pipeline.has_input("workouts_df") and (
+        pipeline.fingerprint("workouts_df") == fingerprint
+    ):
+        return pipeline, False
+    partition = export_pipeline.get("partitions")[discipline]
+    pipeline.set_input("workouts_df", partition, fingerprint=fingerprint)
+    return pipeline, True
+
+
+def build_aggregations(pipeline, mode=None, workers=None):
+    # The aggregations are independent of each other, so with the thread build mode
+    # they are computed concurrently; pandas releases the GIL in its group-by kernels
+    mode = mode or build_mode()
+    executor = None
+    if mode == "thread":
+        executor = get_build_executor(mode, workers)
+    aggregations = pipeline.get_many(
+        ["aggregation/" + name for name in AGGREGATIONS], executor=executor
     )
-    st.session_state["workouts_aggregation_by_week"] = Aggregation(
-        workouts_df, "c_week", extra_indices=date_range.apply(datetime_to_week_index)
+    return {name: aggregations["aggregation/" + name] for name in AGGREGATIONS}
+
+
+def _accumulate_in_processes(workouts_df, group_bys=None, metrics=None, workers=None):
+    executor = get_build_executor("process", workers)
+    if executor is None:
+        return {
+            name: accumulate(workouts_df, group_by, metrics=metrics)
+            for name, group_by in group_bys.items()
+        }
+    return accumulate_in_processes(workouts_df, group_bys, executor, metrics=metrics)
+
+
+def accumulate(workouts_df, group_by=None, metrics=None):
+    # Expects a frame from normalize_workouts_df, so every column is already numeric
+    # and in canonical units and the whole thing is a single group-by. metrics limits
+    # the accumulators to the columns a discipline has (default: all of them).
+    if isinstance(group_by, list):
+        # Group by several columns at once, e.g. rider and instructor
+        workouts_df = workouts_df.dropna(subset=group_by)
+        keys = [workouts_df[column] for column in group_by]
+    elif group_by:
+        # Skip rows with an invalid key
+        workouts_df = workouts_df[workouts_df[group_by].notna()]
+        keys = workouts_df[group_by].values
+    else:
+        keys = np.full(len(workouts_df), "All Time", dtype=object)
+
+    # Duration is missing when a scenic ride has no distance or speed either. Every
+    # average is weighted by the workout length, so those rides only count towards
+    # the workout count and the distance.
+    duration = workouts_df["c_duration"]
+
+    def weighted(column, weight_values=True):
+        values = workouts_df[column].where(duration.notna())
+        minutes = duration.where(values.notna())
+        if weight_values:
+            values = values * duration
+        return values.fillna(0.0), minutes.fillna(0.0)
+
+    columns = {
+        "total_workouts": pd.Series(1, index=workouts_df.index, dtype="int64"),
+        "total_time": duration.fillna(0.0),
+    }
+    for metric in METRIC_COLUMNS if metrics is None else metrics:
+        if metric == "Distance (mi)":
+            columns["total_distance"] = workouts_df[metric].fillna(0.0)
+            continue
+        name, weight_values = WEIGHTED_METRICS[metric]
+        columns[name], columns[name + "_minutes"] = weighted(metric, weight_values)
+
+    accumulators = pd.DataFrame(columns)
+    # observed=True keeps categorical keys to the combinations that exist
+    return accumulators.groupby(keys, observed=True).sum()
+
+
+def build_activity_cube(workouts_df, metrics=None):
+    # A (instructor, class type, weekday, hour) cube of accumulators built in one
+    # group-by. Accumulators are plain sums, so any slice of it is a sum over levels.
+    cube_df = workouts_df.assign(
+        **{
+            "Instructor Name": workouts_df["Instructor Name"].fillna(NO_INSTRUCTOR),
+            "Type": workouts_df["Type"].fillna(NO_CLASS_TYPE),
+        }
     )
-    st.session_state["workouts_aggregation_by_day"] = Aggregation(
-        workouts_df, "c_day", extra_indices=date_range.apply(datetime_to_day_index)
+    return accumulate(
+        cube_df, ["Instructor Name", "Type", "c_weekday", "c_hour"], metrics=metrics
     )
-    st.session_state["workouts_aggregation_by_instructor"] = Aggregation(
-        workouts_df, "Instructor Name"
+
+
+def slice_activity_cube(cube, instructor=None, class_type=None):
+    # The 7x24 weekday-by-hour Aggregation for one instructor and/or class type
+    if instructor is not None:
+        cube = cube[cube.index.get_level_values("Instructor Name") == instructor]
+    if class_type is not None:
+        cube = cube[cube.index.get_level_values("Type") == class_type]
+    accumulators = cube.groupby(level=["c_weekday", "c_hour"]).sum()
+    accumulators = accumulators.reindex(
+        pd.MultiIndex.from_product(
+            [range(7), range(24)], names=["c_weekday", "c_hour"]
+        ),
+        fill_value=0,
     )
-    st.session_state["workouts_aggregation_by_class_type"] = Aggregation(
-        workouts_df, "Type"
+    return Aggregation.from_accumulators(accumulators, group_by=["c_weekday", "c_hour"])
+
+
+def sketch_metrics_df(workouts_df, group_by=None, metrics=None):
+    # The per-workout sketch metrics of every groupable workout, and its group keys
+    sketch_metrics = [
+        name
+        for name, source in SKETCH_METRIC_SOURCES.items()
+        if metrics is None or source in metrics
+    ]
+    if group_by:
+        workouts_df = workouts_df[workouts_df[group_by].notna()]
+        keys = workouts_df[group_by].values
+    else:
+        keys = np.full(len(workouts_df), "All Time", dtype=object)
+
+    metrics_df = pd.DataFrame(
+        {name: SKETCH_METRICS[name](workouts_df) for name in sketch_metrics},
+        index=workouts_df.index,
     )
-    st.session_state["workouts_aggregation_by_class_length"] = Aggregation(
-        workouts_df, "Length (minutes)"
+    return metrics_df, keys
+
+
+def build_sketches(workouts_df, group_by=None, metrics=None, k=200):
+    # One bounded-size sketch per (group, metric), so day-level buckets over long
+    # histories never hold every value
+    metrics_df, keys = sketch_metrics_df(workouts_df, group_by, metrics)
+    return _sketch_groups(metrics_df, keys, k)
+
+
+def _sketch_groups(metrics_df, keys, k):
+    sketches = {}
+    for key, group in metrics_df.groupby(keys):
+        sketches[key] = {}
+        for name in metrics_df.columns:
+            sketch = KLLSketch(k=k)
+            sketch.update_many(group[name].values)
+            sketches[key][name] = sketch
+    return sketches
+
+
+def build_quantiles(workouts_df, group_by=None, metrics=None, k=200):
+    # The SKETCH_QUANTILES of each group. A sketch of at most k values is exact
+    # anyway, so those groups (every day, most weeks) are ranked directly in one
+    # vectorized pass and only larger groups are sketched.
+    metrics_df, keys = sketch_metrics_df(workouts_df, group_by, metrics)
+    sizes = pd.Series(keys).groupby(keys).transform("size").to_numpy()
+    small = sizes <= k
+
+    quantiles_df = exact_quantiles(metrics_df[small], keys[small])
+    if not small.all():
+        quantiles_df = pd.concat(
+            [
+                quantiles_df,
+                sketch_quantiles(_sketch_groups(metrics_df[~small], keys[~small], k)),
+            ]
+        )
+    columns = [
+        "{} {}".format(name, label)
+        for name in metrics_df.columns
+        for label in SKETCH_QUANTILES
+    ]
+    return quantiles_df.reindex(columns=columns).sort_index()
+
+
+def exact_quantiles(metrics_df, keys):
+    # The SKETCH_QUANTILES of each group with the same rank rule as
+    # KLLSketch.quantiles: the first value whose rank reaches q * n, never an
+    # interpolation. Small and sketched groups then report the same statistic.
+    codes, uniques = pd.factorize(keys)
+    columns = {}
+    for name in metrics_df.columns:
+        values = metrics_df[name].to_numpy(dtype="float64")
+        valid = ~np.isnan(values)
+        group_codes, values = codes[valid], values[valid]
+        values = values[np.lexsort((values, group_codes))]
+        counts = np.bincount(group_codes, minlength=len(uniques))
+        starts = np.cumsum(counts) - counts
+        nonempty = counts > 0
+        for label, q in SKETCH_QUANTILES.items():
+            ranks = np.maximum(np.ceil(q * counts) - 1, 0).astype("int64")
+            column = np.full(len(uniques), np.nan)
+            column[nonempty] = values[(starts + ranks)[nonempty]]
+            columns["{} {}".format(name, label)] = column
+    return pd.DataFrame(columns, index=pd.Index(np.asarray(uniques)))
+
+
+def sketch_quantiles(sketches):
+    rows = {}
+    for key, group_sketches in sketches.items():
+        row = {}
+        for name, sketch in group_sketches.items():
+            values = sketch.quantiles(list(SKETCH_QUANTILES.values()))
+            for label, value in zip(SKETCH_QUANTILES, values):
+                row["{} {}".format(name, label)] = value
+        rows[key] = row
+    return pd.DataFrame.from_dict(rows, orient="index").sort_index()
+
+
+COLUMN_FORMATS = {
+    "Total Workouts": "{:,.0f}",
+    "Total Minutes": "{:,.0f}",
+    "Total Distance": "{:,.2f}",
+    "Total Output": "{:,.0f}",
+    "Total Calories": "{:,.0f}",
+    "Avg. Output (watts)": "{:,.2f}",
+    "Avg. Output (kj/m)": "{:,.2f}",
+    "Avg. Calories per Minute": "{:,.2f}",
+    "Avg. Heartrate": "{:,.2f}",
+    "Avg. Speed (mph)": "{:,.2f}",
+    "Avg. Cadence (RPM)": "{:,.2f}",
+}
+
+
+def style_aggregated_df(aggregated_df):
+    return aggregated_df.style.format(
+        {
+            column: column_format
+            for column, column_format in COLUMN_FORMATS.items()
+            if column in aggregated_df.columns
+        },
     )
 
 
@@ -84,143 +601,48 @@ class Aggregation(object):
         self,
         workouts_df,
         group_by=None,
-        extra_indices=None,
+        accumulators=None,
+        index_function=None,
+        day_span=None,
     ):
         self.group_by = group_by
+        self.index_function = index_function
+        self.day_span = day_span
 
-        # These accumulators hold the values over the iterations
-        total_workouts = defaultdict(lambda: 0)
-        total_time = defaultdict(lambda: 0.0)
-        total_distance = defaultdict(lambda: 0.0)
-        total_output = defaultdict(lambda: 0.0)
-        total_output_minutes = defaultdict(lambda: 0.0)
-        total_calories = defaultdict(lambda: 0.0)
-        total_calories_minutes = defaultdict(lambda: 0.0)
-        total_hr = defaultdict(lambda: 0.0)
-        total_hr_minutes = defaultdict(lambda: 0.0)
-        total_speed = defaultdict(lambda: 0.0)
-        total_speed_minutes = defaultdict(lambda: 0.0)
-        total_cadence = defaultdict(lambda: 0.0)
-        total_cadence_minutes = defaultdict(lambda: 0.0)
-        total_resistance = defaultdict(lambda: 0.0)
-        total_resistance_minutes = defaultdict(lambda: 0.0)
-
-        if extra_indices is not None:
-            for index in extra_indices:
-                total_workouts[index] = 0
-                total_time[index] = 0.0
-                total_distance[index] = 0.0
-                total_output[index] = 0.0
-                total_output_minutes[index] = 0.0
-                total_calories[index] = 0.0
-                total_calories_minutes[index] = 0.0
-                total_hr[index] = 0.0
-                total_hr_minutes[index] = 0.0
-                total_speed[index] = 0.0
-                total_speed_minutes[index] = 0.0
-                total_cadence[index] = 0.0
-                total_cadence_minutes[index] = 0.0
-                total_resistance[index] = 0.0
-                total_resistance_minutes[index] = 0.0
-
-        for _, row in workouts_df.iterrows():
-            # Get the value for the group_by column
-            if group_by:
-                key = row[group_by]
-
-                # Skip rows with an invalid key
-                if pd.isnull(key):
-                    continue
-            else:
-                key = "All Time"
-
-            # Update the accumulators
-            total_workouts[key] += 1
-            try:
-                if not pd.isna(row["Distance (mi)"]):
-                    total_distance[key] += row["Distance (mi)"]
-            except KeyError:
-                if not pd.isna(row["Distance (km)"]):
-                    total_distance[key] += row["Distance (km)"] * 0.621371
-
-            duration = None
-            if not pd.isna(row["Length (minutes)"]) and (
-                row["Length (minutes)"] != "None"
-            ):
-                duration = int(row["Length (minutes)"])
-            elif row["Length (minutes)"] == "None":
-                duration = (row["Distance (mi)"] / row["Avg. Speed (mph)"]) * 60
-
-            if duration is not None:
-                total_time[key] += duration
-                # These are nested inside the Length if-clause because we need to
-                # weight the values by the workout length. Length is missing for scenic
-                #  rides.
-                if not pd.isna(row["Total Output"]):
-                    total_output[key] += row["Total Output"]
-                    total_output_minutes[key] += duration
-                if not pd.isna(row["Calories Burned"]):
-                    total_calories[key] += row["Calories Burned"]
-                    total_calories_minutes[key] += duration
-                if not pd.isna(row["Avg. Heartrate"]):
-                    total_hr[key] += duration * row["Avg. Heartrate"]
-                    total_hr_minutes[key] += duration
-
-                try:
-                    if not pd.isna(row["Avg. Speed (mph)"]):
-                        total_speed[key] += duration * row["Avg. Speed (mph)"]
-                        total_speed_minutes[key] += duration
-                except KeyError:
-                    if not pd.isna(row["Avg. Speed (kph)"]):
-                        total_speed[key] += (
-                            duration * row["Avg. Speed (kph)"] * 0.621371
-                        )
-                        total_speed_minutes[key] += duration
-
-                if not pd.isna(row["Avg. Cadence (RPM)"]):
-                    total_cadence[key] += duration * row["Avg. Cadence (RPM)"]
-                    total_cadence_minutes[key] += duration
-                if not pd.isna(row["Avg. Resistance"]):
-                    total_resistance[key] += duration * float(
-                        row["Avg. Resistance"].strip("%")
-                    )
-                    total_resistance_minutes[key] += duration
+        if accumulators is None:
+            accumulators = accumulate(workouts_df, group_by)
+        self.accumulators = accumulators
 
         self.aggregated_df = pd.DataFrame(
             {
-                "Total Workouts": pd.Series(total_workouts),
-                "Total Minutes": pd.Series(total_time),
-                "Total Distance": pd.Series(total_distance),
-                "Total Output": pd.Series(total_output),
-                "Total Calories": pd.Series(total_calories),
-                "Avg. Output (watts)": (100.0 / 6.0)
-                * pd.Series(total_output)
-                / pd.Series(total_output_minutes),
-                "Avg. Output (kj/m)": pd.Series(total_output)
-                / pd.Series(total_output_minutes),
-                "Avg. Calories per Minute": pd.Series(total_calories)
-                / pd.Series(total_calories_minutes),
-                "Avg. Heartrate": pd.Series(total_hr) / pd.Series(total_hr_minutes),
-                "Avg. Speed (mph)": pd.Series(total_speed)
-                / pd.Series(total_speed_minutes),
-                "Avg. Cadence (RPM)": pd.Series(total_cadence)
-                / pd.Series(total_cadence_minutes),
-                "Avg. Resistance": pd.Series(total_resistance)
-                / pd.Series(total_resistance_minutes),
-            }
-        ).sort_index()
-        self.styled_aggregated_df = self.aggregated_df.style.format(
-            {
-                "Total Workouts": "{:,.0f}",
-                "Total Minutes": "{:,.0f}",
-                "Total Distance": "{:,.2f}",
-                "Total Output": "{:,.0f}",
-                "Total Calories": "{:,.0f}",
-                "Avg. Output (watts)": "{:,.2f}",
-                "Avg. Output (kj/m)": "{:,.2f}",
-                "Avg. Calories per Minute": "{:,.2f}",
-                "Avg. Heartrate": "{:,.2f}",
-                "Avg. Speed (mph)": "{:,.2f}",
-                "Avg. Cadence (RPM)": "{:,.2f}",
+                column: aggregate(accumulators)
+                for column, accumulator, aggregate in AGGREGATED_COLUMNS
+                if accumulator in accumulators.columns
             },
+            index=accumulators.index,
+        ).sort_index()
+
+    @classmethod
+    def from_accumulators(
+        cls, accumulators, day_span=None, group_by=None, index_function=None
+    ):
+        return cls(
+            None,
+            group_by=group_by,
+            accumulators=accumulators,
+            index_function=index_function,
+            day_span=day_span,
+        )
+
+    def densified(self, start=None, end=None):
+        # A copy of a sparse time aggregation with every bucket between start and end
+        # (defaulting to the first and last ride), empty buckets filled with zeros
+        start = start if start is not None else self.day_span[0]
+        end = end if end is not None else self.day_span[1]
+        keys = bucket_keys(self.index_function, start, end)
+        return Aggregation.from_accumulators(
+            self.accumulators.reindex(keys, fill_value=0),
+            day_span=(start, end),
+            group_by=self.group_by,
+            index_function=self.index_function,
         )
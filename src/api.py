@@ -0,0 +1,353 @@
+import argparse
+import datetime
+import hashlib
+import io
+import json
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pyarrow as pa
+
+from aggregation import (
+    AGGREGATIONS,
+    Aggregation,
+    accumulate,
+    build_export_pipeline,
+    load_discipline,
+)
+from disciplines import DEFAULT_DISCIPLINE, discipline_metrics
+from report_bundle import export_aggregated_df
+from schema import UnsupportedExportError, detect_export_variant
+
+# Routes:
+#   POST /datasets                          body: a workouts.csv export
+#   GET  /datasets/<id>                     disciplines and aggregation names
+#   GET  /datasets/<id>/aggregations/<name> ?discipline=&start=&end=&format=
+# Aggregations are JSON records by default, or an Arrow IPC stream with
+# format=arrow or an Accept header of ARROW_CONTENT_TYPE.
+DEFAULT_PORT = 8765
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+JSON_CONTENT_TYPE = "application/json"
+
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+# How many uploaded datasets, and rendered responses (and bytes of them) per
+# dataset, are kept
+MAX_DATASETS = 16
+MAX_CACHED_RESPONSES = 256
+MAX_CACHED_RESPONSE_BYTES = 32 * 1024 * 1024
+
+logger = logging.getLogger("pelotonnes.api")
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_date(query, key):
+    values = query.get(key)
+    if not values:
+        return None
+    try:
+        return datetime.date.fromisoformat(values[0])
+    except ValueError:
+        raise ApiError(400, "{} must be a YYYY-MM-DD date".format(key))
+
+
+def aggregate_date_range(pipeline, name, discipline, start, end):
+    # The named aggregation restricted to workouts between start and end. Without a
+    # range it is the cached one from the pipeline. The range is clipped to the
+    # days with workouts, so an open-ended date like 9999-12-31 doesn't densify into
+    # millions of empty buckets.
+    first_day, last_day = pipeline.get("day_span")
+    if start is not None and start <= first_day:
+        start = None
+    if end is not None and end >= last_day:
+        end = None
+    if start is None and end is None:
+        aggregation = pipeline.get("aggregation/" + name)
+    else:
+        workouts_df = pipeline.get("workouts_df")
+        in_range = pd.Series(True, index=workouts_df.index)
+        if start is not None:
+            in_range &= workouts_df["c_day"] >= start
+        if end is not None:
+            in_range &= workouts_df["c_day"] <= end
+        group_by, index_function = AGGREGATIONS[name]
+        aggregation = Aggregation.from_accumulators(
+            accumulate(
+                workouts_df[in_range], group_by, metrics=discipline_metrics(discipline)
+            ),
+            day_span=(start or first_day, end or last_day),
+            group_by=group_by,
+            index_function=index_function,
+        )
+    # Time series are sent with every bucket, like the download bundle
+    if aggregation.index_function is not None:
+        aggregation = aggregation.densified()
+    return aggregation
+
+
+def serialize(aggregated_df, output_format):
+    if output_format == "arrow":
+        # Index values like dates and years are mixed types in object columns
+        table = pa.Table.from_pandas(
+            aggregated_df.astype({aggregated_df.columns[0]: str}), preserve_index=False
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_CONTENT_TYPE
+    body = aggregated_df.to_json(orient="records", date_format="iso")
+    return body.encode("utf-8"), JSON_CONTENT_TYPE
+
+
+class Dataset(object):
+    # One uploaded export, processed with the same pipelines as the app. Pipelines
+    # aren't thread safe, so building artifacts holds the dataset's lock; serving a
+    # cached response doesn't.
+    def __init__(self, dataset_id, raw_workouts_df):
+        self.dataset_id = dataset_id
+        self.export_pipeline = build_export_pipeline()
+        self.export_pipeline.set_input(
+            "raw_workouts_df", raw_workouts_df, fingerprint=dataset_id
+        )
+        self.partitions = self.export_pipeline.get("partitions")
+        self._pipelines = {}
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+        self._responses_bytes = 0
+        self._responses_lock = threading.Lock()
+
+    def describe(self):
+        return {
+            "dataset_id": self.dataset_id,
+            "disciplines": {
+                discipline: len(partition)
+                for discipline, partition in self.partitions.items()
+            },
+            "aggregations": list(AGGREGATIONS),
+        }
+
+    def etag(self, *key):
+        # Strong: the same upload and parameters always produce the same bytes
+        hasher = hashlib.sha1(self.dataset_id.encode("utf-8"))
+        hasher.update(repr(key).encode("utf-8"))
+        return '"{}"'.format(hasher.hexdigest())
+
+    def aggregation_response(self, name, discipline, start, end, output_format):
+        key = (name, discipline, start, end, output_format)
+        with self._responses_lock:
+            if key in self._responses:
+                self._responses.move_to_end(key)
+                return self._responses[key]
+
+        with self._lock:
+            pipeline, _ = load_discipline(
+                self.export_pipeline, self._pipelines, discipline
+            )
+            aggregation = aggregate_date_range(pipeline, name, discipline, start, end)
+        body, content_type = serialize(
+            export_aggregated_df(name, aggregation), output_format
+        )
+        response = (body, content_type)
+
+        with self._responses_lock:
+            if key not in self._responses and len(body) <= MAX_CACHED_RESPONSE_BYTES:
+                self._responses[key] = response
+                self._responses_bytes += len(body)
+            while (
+                len(self._responses) > MAX_CACHED_RESPONSES
+                or self._responses_bytes > MAX_CACHED_RESPONSE_BYTES
+            ):
+                _, (evicted, _) = self._responses.popitem(last=False)
+                self._responses_bytes -= len(evicted)
+        return response
+
+
+class DatasetStore(object):
+    # Uploaded datasets keyed by a hash of their content, so uploading the same
+    # export again returns the existing dataset id
+    def __init__(self, max_datasets=MAX_DATASETS):
+        self.max_datasets = max_datasets
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, data):
+        dataset_id = hashlib.sha256(data).hexdigest()[:32]
+        with self._lock:
+            if dataset_id in self._datasets:
+                self._datasets.move_to_end(dataset_id)
+                return self._datasets[dataset_id]
+
+        try:
+            raw_workouts_df = pd.read_csv(io.BytesIO(data))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ApiError(400, "Could not read the upload as CSV: {}".format(e))
+        try:
+            detect_export_variant(raw_workouts_df)
+            dataset = Dataset(dataset_id, raw_workouts_df)
+        except UnsupportedExportError as e:
+            raise ApiError(400, str(e))
+
+        with self._lock:
+            self._datasets[dataset_id] = dataset
+            while len(self._datasets) > self.max_datasets:
+                self._datasets.popitem(last=False)
+        return dataset
+
+    def get(self, dataset_id):
+        with self._lock:
+            dataset = self._datasets.get(dataset_id)
+        if dataset is None:
+            raise ApiError(404, "Unknown dataset: {}".format(dataset_id))
+        return dataset
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def _handle(self, route):
+        try:
+            route(urlparse(self.path))
+        except ApiError as e:
+            # An unread request body would be parsed as the next request
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+        except Exception:
+            logger.exception("Failed to handle %s %s", self.command, self.path)
+            self.close_connection = True
+            self._send_json(500, {"error": "Internal server error"})
+
+    def _post(self, url):
+        if url.path.rstrip("/") != "/datasets":
+            raise ApiError(404, "Not found")
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise ApiError(411, "Uploads need a Content-Length")
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ApiError(400, "Content-Length must be a non-negative integer")
+        if length > MAX_UPLOAD_BYTES:
+            raise ApiError(
+                413, "Uploads are limited to {} bytes".format(MAX_UPLOAD_BYTES)
+            )
+        dataset = self.store.add(self.rfile.read(length))
+        self._send_json(201, dataset.describe())
+
+    def _get(self, url):
+        parts = [part for part in url.path.split("/") if part]
+        if len(parts) == 2 and parts[0] == "datasets":
+            dataset = self.store.get(parts[1])
+            self._send_cached(
+                dataset.etag("describe"),
+                lambda: (
+                    json.dumps(dataset.describe()).encode("utf-8"),
+                    JSON_CONTENT_TYPE,
+                ),
+            )
+        elif len(parts) == 4 and parts[0] == "datasets" and parts[2] == "aggregations":
+            self._get_aggregation(self.store.get(parts[1]), parts[3], url)
+        else:
+            raise ApiError(404, "Not found")
+
+    def _get_aggregation(self, dataset, name, url):
+        if name not in AGGREGATIONS:
+            raise ApiError(404, "Unknown aggregation: {}".format(name))
+        query = parse_qs(url.query)
+        discipline = query.get("discipline", [DEFAULT_DISCIPLINE])[0]
+        if discipline not in dataset.partitions:
+            raise ApiError(404, "No {} workouts in this dataset".format(discipline))
+        start, end = parse_date(query, "start"), parse_date(query, "end")
+        if start is not None and end is not None and start > end:
+            raise ApiError(400, "start must not be after end")
+
+        output_format = query.get("format", [None])[0]
+        if output_format is None:
+            accept = self.headers.get("Accept", "")
+            output_format = "arrow" if ARROW_CONTENT_TYPE in accept else "json"
+        if output_format not in ("json", "arrow"):
+            raise ApiError(400, "format must be json or arrow")
+
+        self._send_cached(
+            dataset.etag(name, discipline, start, end, output_format),
+            lambda: dataset.aggregation_response(
+                name, discipline, start, end, output_format
+            ),
+        )
+
+    def _send_cached(self, etag, make_response):
+        # Clients revalidate every poll; a matching If-None-Match is answered with
+        # a 304 without building or reading the body
+        if_none_match = self.headers.get("If-None-Match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        body, content_type = make_response()
+        self._send(200, body, content_type, {"ETag": etag, "Cache-Control": "no-cache"})
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), JSON_CONTENT_TYPE)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store=None):
+        super().__init__(address, ApiHandler)
+        self.store = store or DatasetStore()
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT):
+    server = ApiServer((host, port))
+    print("Serving the Pelotonnes API on http://{}:{}".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve Pelotonnes aggregations over a local HTTP API."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    serve(args.host, args.port)
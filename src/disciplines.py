@@ -0,0 +1,68 @@
+import hashlib
+
+DEFAULT_DISCIPLINE = "Cycling"
+
+# Every per-workout metric the aggregations know how to summarize, in display order
+METRIC_COLUMNS = [
+    "Distance (mi)",
+    "Total Output",
+    "Calories Burned",
+    "Avg. Heartrate",
+    "Avg. Speed (mph)",
+    "Avg. Cadence (RPM)",
+    "Avg. Resistance",
+]
+
+# The metrics each discipline's export rows actually carry. Everything else is empty
+# for that discipline, so it is neither accumulated nor shown.
+DISCIPLINE_METRICS = {
+    "Cycling": METRIC_COLUMNS,
+    "Running": [
+        "Distance (mi)",
+        "Calories Burned",
+        "Avg. Heartrate",
+        "Avg. Speed (mph)",
+    ],
+    "Walking": [
+        "Distance (mi)",
+        "Calories Burned",
+        "Avg. Heartrate",
+        "Avg. Speed (mph)",
+    ],
+    "Rowing": [
+        "Distance (mi)",
+        "Total Output",
+        "Calories Burned",
+        "Avg. Heartrate",
+        "Avg. Speed (mph)",
+    ],
+}
+# Strength, yoga, stretching, meditation and anything new
+DEFAULT_METRICS = ["Calories Burned", "Avg. Heartrate"]
+
+
+def discipline_metrics(discipline):
+    return DISCIPLINE_METRICS.get(discipline, DEFAULT_METRICS)
+
+
+def partition_by_discipline(workouts_df):
+    # One frame per discipline, split in a single group-by over the parsed export.
+    # The default discipline comes first, then the rest by number of workouts.
+    partitions = {
+        discipline: partition
+        for discipline, partition in workouts_df.groupby(
+            "Fitness Discipline", sort=False
+        )
+    }
+    return dict(
+        sorted(
+            partitions.items(),
+            key=lambda item: (item[0] != DEFAULT_DISCIPLINE, -len(item[1]), item[0]),
+        )
+    )
+
+
+def partition_fingerprint(export_fingerprint, discipline):
+    return hashlib.sha1(
+        "{}|{}".format(export_fingerprint, discipline).encode("utf-8")
+    ).hexdigest()
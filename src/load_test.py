@@ -0,0 +1,307 @@
+import argparse
+import http.client
+import json
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import aggregation
+import main
+from api import ApiServer
+from parallel_build import BUILD_MODES, build_workers
+from streamlit_stub import StubSession, StubUploadedFile, stub_streamlit
+from synthetic_workouts import make_workouts_csv, make_workouts_df
+
+UPLOAD_PAGE = "Upload Workouts"
+
+# Relative likelihood of a user switching to each page after the upload
+PAGE_WEIGHTS = {
+    "Upload Workouts": 1,
+    "All-Time Stats": 4,
+    "Personal Records": 2,
+    "Stats By Instructor": 3,
+    "Stats By Class Type": 2,
+    "Stats By Class Length": 1,
+    "Stats By Year": 1,
+    "Stats By Month": 2,
+    "Stats By Week": 2,
+    "Stats By Day": 1,
+    "Stats By Day & Hour": 1,
+    "Compare Riders": 1,
+    "About": 1,
+}
+
+
+def page_sequence(rng, n_reruns):
+    # Every session starts by uploading, then wanders between pages
+    names = list(PAGE_WEIGHTS.keys())
+    weights = list(PAGE_WEIGHTS.values())
+    return [UPLOAD_PAGE] + rng.choices(names, weights=weights, k=n_reruns - 1)
+
+
+def run_session(stub, session_id, upload, n_reruns, seed):
+    rng = random.Random(seed + session_id)
+    session = StubSession(
+        StubUploadedFile("workouts_{}.csv".format(session_id), upload)
+    )
+    latencies = []
+    with stub.session(session):
+        for page in page_sequence(rng, n_reruns):
+            start = time.perf_counter()
+            with stub.telemetry.measure(page):
+                main.pages[page]()
+            latencies.append((page, time.perf_counter() - start))
+    return latencies, session
+
+
+def max_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_load_test(n_sessions=8, n_reruns=20, n_workouts=1000, seed=0):
+    upload = make_workouts_csv(n_workouts, seed=seed)
+    rss_before = max_rss_mb()
+
+    with stub_streamlit() as stub:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_sessions) as executor:
+            futures = [
+                executor.submit(run_session, stub, session_id, upload, n_reruns, seed)
+                for session_id in range(n_sessions)
+            ]
+            results = [future.result() for future in futures]
+        wall_time = time.perf_counter() - start
+
+    latencies = [
+        latency for session_latencies, _ in results for latency in session_latencies
+    ]
+    return {
+        "sessions": n_sessions,
+        "reruns": len(latencies),
+        "wall_time": wall_time,
+        "latencies": latencies,
+        "payload_bytes": sum(session.payload_bytes for _, session in results),
+        "telemetry": stub.telemetry,
+        "rss_before_mb": rss_before,
+        "rss_after_mb": max_rss_mb(),
+    }
+
+
+def benchmark_build(n_workouts=1000, workers=None, seed=0, repeats=3):
+    # Best-of-n time to build every aggregation from an already parsed frame, for
+    # each build mode
+    workers = workers or build_workers()
+    export_pipeline = aggregation.build_export_pipeline()
+    export_pipeline.set_input(
+        "raw_workouts_df", make_workouts_df(n_workouts, seed=seed)
+    )
+    workouts_df = export_pipeline.get("partitions")["Cycling"]
+
+    timings = {}
+    for mode in BUILD_MODES:
+        best = None
+        # The first round warms up the worker pool and is not counted
+        for _ in range(repeats + 1):
+            pipeline = aggregation.build_workouts_pipeline(mode=mode, workers=workers)
+            pipeline.set_input("workouts_df", workouts_df)
+            pipeline.get("day_span")
+            start = time.perf_counter()
+            aggregation.build_aggregations(pipeline, mode=mode, workers=workers)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[mode] = best
+    return {"workers": workers, "workouts": n_workouts, "timings": timings}
+
+
+API_DATE_RANGES = [
+    "?start=2021-01-01&end=2021-06-30",
+    "?start=2021-07-01&end=9999-12-31",
+    "?start=0001-01-01&end=2021-03-31",
+]
+
+
+def run_api_client(port, dataset_id, n_requests, seed):
+    # A dashboard stand-in: polls random aggregations over one keep-alive
+    # connection, revalidating with the last ETag it saw for each URL
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    etags = {}
+    latencies = []
+    try:
+        for _ in range(n_requests):
+            url = "/datasets/{}/aggregations/{}".format(
+                dataset_id, rng.choice(list(aggregation.AGGREGATIONS))
+            )
+            if rng.random() < 0.3:
+                # Includes open-ended ranges reaching far outside the data
+                url += rng.choice(API_DATE_RANGES)
+            headers = {"If-None-Match": etags[url]} if url in etags else {}
+            start = time.perf_counter()
+            connection.request("GET", url, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            latencies.append((response.status, time.perf_counter() - start))
+            etags[url] = response.getheader("ETag")
+    finally:
+        connection.close()
+    return latencies
+
+
+def benchmark_api(n_clients=8, n_requests=50, n_workouts=1000, seed=0):
+    server = ApiServer(("127.0.0.1", 0))
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        upload = make_workouts_csv(n_workouts, seed=seed)
+        start = time.perf_counter()
+        connection.request("POST", "/datasets", body=upload)
+        response = connection.getresponse()
+        dataset_id = json.loads(response.read())["dataset_id"]
+        upload_time = time.perf_counter() - start
+        connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_clients) as executor:
+            futures = [
+                executor.submit(run_api_client, port, dataset_id, n_requests, seed + i)
+                for i in range(n_clients)
+            ]
+            latencies = [latency for future in futures for latency in future.result()]
+        wall_time = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        "clients": n_clients,
+        "upload_time": upload_time,
+        "wall_time": wall_time,
+        "latencies": latencies,
+    }
+
+
+def print_api_report(report):
+    print(
+        "\nAPI: upload {:.0f}ms, {} clients, {} requests in {:.2f}s "
+        "({:.0f} req/s)".format(
+            report["upload_time"] * 1000.0,
+            report["clients"],
+            len(report["latencies"]),
+            report["wall_time"],
+            len(report["latencies"]) / report["wall_time"],
+        )
+    )
+    print("{:<24}{:>8}{:>10}{:>10}".format("Status", "Count", "p50 ms", "p95 ms"))
+    for status in sorted({status for status, _ in report["latencies"]}):
+        seconds = np.array(
+            [latency for s, latency in report["latencies"] if s == status]
+        )
+        p50, p95 = np.percentile(seconds, [50, 95]) * 1000.0
+        print("{:<24}{:>8}{:>10.1f}{:>10.1f}".format(status, len(seconds), p50, p95))
+
+
+def print_build_report(report):
+    serial = report["timings"]["serial"]
+    print(
+        "\nAggregation build, {} workouts, {} workers:".format(
+            report["workouts"], report["workers"]
+        )
+    )
+    for mode, elapsed in report["timings"].items():
+        print(
+            "{:<24}{:>10.1f}ms{:>10.2f}x".format(
+                mode, elapsed * 1000.0, serial / elapsed
+            )
+        )
+
+
+def print_report(report):
+    seconds = np.array([latency for _, latency in report["latencies"]])
+    print(
+        "{} sessions, {} reruns in {:.2f}s ({:.2f} reruns/s)".format(
+            report["sessions"],
+            report["reruns"],
+            report["wall_time"],
+            report["reruns"] / report["wall_time"],
+        )
+    )
+    print(
+        "Rerun latency: p50 {:.1f}ms, p95 {:.1f}ms, p99 {:.1f}ms".format(
+            *(np.percentile(seconds, [50, 95, 99]) * 1000.0)
+        )
+    )
+    print(
+        "Peak RSS: {:.1f}MB -> {:.1f}MB (+{:.1f}MB)".format(
+            report["rss_before_mb"],
+            report["rss_after_mb"],
+            report["rss_after_mb"] - report["rss_before_mb"],
+        )
+    )
+    print("Payload sent: {:.1f}MB".format(report["payload_bytes"] / 1e6))
+
+    print("\n{:<24}{:>8}{:>10}{:>10}".format("Page", "Reruns", "p50 ms", "p95 ms"))
+    for page in PAGE_WEIGHTS:
+        page_seconds = np.array(
+            [latency for name, latency in report["latencies"] if name == page]
+        )
+        if len(page_seconds) == 0:
+            continue
+        p50, p95 = np.percentile(page_seconds, [50, 95]) * 1000.0
+        print("{:<24}{:>8}{:>10.1f}{:>10.1f}".format(page, len(page_seconds), p50, p95))
+
+
+def print_payload_report(telemetry):
+    print(
+        "\n{:<24}{:>12}{:>12}{:>12}{:>8}".format(
+            "Page", "p50 KB", "p95 KB", "Budget KB", "Over"
+        )
+    )
+    summary_df = telemetry.summary_df()
+    for page, row in summary_df.iterrows():
+        print(
+            "{:<24}{:>12.0f}{:>12.0f}{:>12.0f}{:>8}".format(
+                page,
+                row["Payload p50 (KB)"],
+                row["Payload p95 (KB)"],
+                row["Budget (KB)"],
+                int(row["Over budget"]),
+            )
+        )
+    return int(summary_df["Over budget"].sum()) if len(summary_df) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent Pelotonnes sessions against a stub Streamlit."
+    )
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--workouts", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Workers for the build benchmark"
+    )
+    parser.add_argument("--api-clients", type=int, default=8)
+    parser.add_argument("--api-requests", type=int, default=50)
+    parser.add_argument(
+        "--enforce-budgets",
+        action="store_true",
+        help="Exit with an error if any page render went over its payload budget",
+    )
+    args = parser.parse_args()
+
+    report = run_load_test(args.sessions, args.reruns, args.workouts, args.seed)
+    print_report(report)
+    n_over_budget = print_payload_report(report["telemetry"])
+    print_build_report(benchmark_build(args.workouts, args.workers, args.seed))
+    print_api_report(
+        benchmark_api(args.api_clients, args.api_requests, args.workouts, args.seed)
+    )
+    if args.enforce_budgets and n_over_budget:
+        raise SystemExit("{} page renders went over budget".format(n_over_budget))
@@ -1,11 +1,36 @@
+import hashlib
+
 import pandas as pd
 import streamlit as st
-import streamlit_analytics as sta
 
-from aggregation import process_workouts_df
+from aggregation import process_workouts_df, select_discipline
+from analytics import get_tracker
 from render_stats_by_time import render_stats_by_time
 from render_stats_by_class import render_stats_by_class
 from render_stats_all_time import render_stats_all_time
+from render_personal_records import render_personal_records
+from render_compare_riders import render_compare_riders
+from render_activity_by_hour import render_activity_by_hour
+from render_page_telemetry import render_page_telemetry
+from report_bundle import BUNDLE_FILE_NAME, get_report_bundle_builder
+from schema import UnsupportedExportError, detect_export_variant
+from telemetry import get_telemetry, instrument_streamlit
+
+
+def fingerprint_upload(uploaded_file):
+    content_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return "{}:{}:{}".format(uploaded_file.name, uploaded_file.size, content_hash)
+
+
+# Everything derived from an upload, cleared together when an upload is rejected
+UPLOAD_SESSION_KEYS = [
+    "workouts_df",
+    "workouts_partitions",
+    "workouts_pipeline",
+    "export_pipeline",
+    "discipline_pipelines",
+    "upload_fingerprint",
+]
 
 
 def render_upload_workouts():
@@ -27,72 +52,102 @@ def render_upload_workouts():
         help=workouts_help,
     )
 
-    if ("workouts_df" in st.session_state) and (raw_workouts is None):
-        workouts_df = st.session_state["workouts_df"]
-
+    # Streamlit hands us the same file on every rerun while it sits in the uploader,
+    # so only do any work when its fingerprint changes
+    upload_fingerprint = None
     if raw_workouts is not None:
+        upload_fingerprint = fingerprint_upload(raw_workouts)
+
+    # A rejected file stays in the uploader too; show its error again without
+    # re-reading it
+    rejected_upload = st.session_state.get("rejected_upload", None)
+    if rejected_upload is not None and rejected_upload[0] == upload_fingerprint:
+        st.error(rejected_upload[1])
+        return
+
+    if (raw_workouts is not None) and (
+        upload_fingerprint != st.session_state.get("upload_fingerprint", None)
+    ):
         workouts_df = pd.read_csv(raw_workouts)
-        workouts_df = workouts_df[workouts_df["Fitness Discipline"] == "Cycling"]
-        st.session_state["workouts_df"] = workouts_df
-
-        # Whether-or-not we've uploaded, process the DF
-        st.markdown("Processing your workouts...")
-        process_workouts_df()
+        try:
+            # Fail fast on files we can't read, before touching session_state. Every
+            # discipline is kept; processing partitions the export by discipline.
+            detect_export_variant(workouts_df)
+            st.session_state["workouts_df"] = workouts_df
+
+            # Whether-or-not we've uploaded, process the DF
+            st.markdown("Processing your workouts...")
+            process_workouts_df(fingerprint=upload_fingerprint)
+        except UnsupportedExportError as e:
+            # Don't leave a half-processed upload behind for the other pages
+            for key in UPLOAD_SESSION_KEYS:
+                st.session_state.pop(key, None)
+            st.session_state["rejected_upload"] = (upload_fingerprint, str(e))
+            st.error(str(e))
+            return
+        st.session_state["upload_fingerprint"] = upload_fingerprint
         st.markdown("{} workouts processed!".format(len(workouts_df)))
 
     if "workouts_df" in st.session_state:
         st.subheader(
             "Upload complete! Use the tools in the sidebar to analyze your workouts."
         )
-        st.subheader("Cycling Workouts")
+        st.subheader("{} Workouts".format(st.session_state["discipline"]))
         st.dataframe(st.session_state["workouts_df"])
 
 
 def render_stats_by_year():
     return render_stats_by_time(
-        aggregation=st.session_state.get("workouts_aggregation_by_year", None),
+        pipeline=st.session_state.get("workouts_pipeline", None),
+        aggregation_name="by_year",
         readable_time_unit="Year",
     )
 
 
 def render_stats_by_month():
     return render_stats_by_time(
-        aggregation=st.session_state.get("workouts_aggregation_by_month", None),
+        pipeline=st.session_state.get("workouts_pipeline", None),
+        aggregation_name="by_month",
         readable_time_unit="Month",
     )
 
 
 def render_stats_by_week():
     return render_stats_by_time(
-        aggregation=st.session_state.get("workouts_aggregation_by_week", None),
+        pipeline=st.session_state.get("workouts_pipeline", None),
+        aggregation_name="by_week",
         readable_time_unit="Week",
     )
 
 
 def render_stats_by_day():
     return render_stats_by_time(
-        aggregation=st.session_state.get("workouts_aggregation_by_day", None),
+        pipeline=st.session_state.get("workouts_pipeline", None),
+        aggregation_name="by_day",
         readable_time_unit="Day",
     )
 
 
 def render_stats_by_instructor():
     return render_stats_by_class(
-        aggregation=st.session_state.get("workouts_aggregation_by_instructor", None),
+        pipeline=st.session_state.get("workouts_pipeline", None),
+        aggregation_name="by_instructor",
         readable_class_characteristic="Instructor",
     )
 
 
 def render_stats_by_class_type():
     return render_stats_by_class(
-        aggregation=st.session_state.get("workouts_aggregation_by_class_type", None),
+        pipeline=st.session_state.get("workouts_pipeline", None),
+        aggregation_name="by_class_type",
         readable_class_characteristic="Class Type",
     )
 
 
 def render_stats_by_class_length():
     return render_stats_by_class(
-        aggregation=st.session_state.get("workouts_aggregation_by_class_length", None),
+        pipeline=st.session_state.get("workouts_pipeline", None),
+        aggregation_name="by_class_length",
         readable_class_characteristic="Class Length",
     )
 
@@ -112,28 +167,86 @@ def render_about():
     st.markdown("To learn more, [message James](https://twitter.com/Jiminy_Kirket).")
 
 
+pages = {
+    "Upload Workouts": render_upload_workouts,
+    "All-Time Stats": render_stats_all_time,
+    "Personal Records": render_personal_records,
+    "Stats By Instructor": render_stats_by_instructor,
+    "Stats By Class Type": render_stats_by_class_type,
+    "Stats By Class Length": render_stats_by_class_length,
+    "Stats By Year": render_stats_by_year,
+    "Stats By Month": render_stats_by_month,
+    "Stats By Week": render_stats_by_week,
+    "Stats By Day": render_stats_by_day,
+    "Stats By Day & Hour": render_activity_by_hour,
+    "Compare Riders": render_compare_riders,
+    "About": render_about,
+}
+
+# The debug view is only useful, and only listed, when pages are being measured
+if get_telemetry().enabled:
+    pages["Page Telemetry"] = render_page_telemetry
+
+
+def render_discipline_selector():
+    # Each discipline's workouts are already parsed and stored in their own
+    # partition, so switching is a lookup plus whatever aggregations are missing
+    partitions = st.session_state.get("workouts_partitions", None)
+    if not partitions:
+        return
+    discipline = st.sidebar.selectbox(
+        "Discipline",
+        options=list(partitions),
+        index=list(partitions).index(st.session_state["discipline"]),
+    )
+    if discipline != st.session_state["discipline"]:
+        select_discipline(discipline)
+
+
+def render_download_bundle():
+    pipeline = st.session_state.get("workouts_pipeline", None)
+    if pipeline is None:
+        return
+
+    builder = get_report_bundle_builder()
+    fingerprint = pipeline.fingerprint("workouts_df")
+    if builder.failed(fingerprint):
+        st.sidebar.error("Your stats download could not be prepared.")
+        return
+    bundle = builder.get(fingerprint)
+    if bundle is None:
+        st.sidebar.markdown("Preparing your stats download...")
+        return
+    st.sidebar.download_button(
+        "Download all stats",
+        data=bundle,
+        file_name=BUNDLE_FILE_NAME,
+        mime="application/zip",
+    )
+
+
 def main():
-    with sta.track():
+    # Events are buffered in memory and flushed by a background thread, so the rerun
+    # only pays for a timer and a deque append
+    with get_tracker().track() as event:
         st.set_page_config(page_title="Pelotonnes", layout="wide")
         st.sidebar.title("Pelotonnes")
 
-        pages = {
-            "Upload Workouts": render_upload_workouts,
-            "All-Time Stats": render_stats_all_time,
-            "Stats By Instructor": render_stats_by_instructor,
-            "Stats By Class Type": render_stats_by_class_type,
-            "Stats By Class Length": render_stats_by_class_length,
-            "Stats By Year": render_stats_by_year,
-            "Stats By Month": render_stats_by_month,
-            "Stats By Week": render_stats_by_week,
-            "Stats By Day": render_stats_by_day,
-            "About": render_about,
-        }
+        render_discipline_selector()
         app_mode = st.sidebar.radio("Tools", options=pages.keys())
         st.session_state["app_mode"] = app_mode
+        event["page"] = app_mode
+
+        # Render the selected page, recording its payload for the telemetry debug view
+        instrument_streamlit(st)
+        with get_telemetry().measure(app_mode) as render:
+            pages[app_mode]()
+        for key in ["payload_bytes", "n_elements"]:
+            if key in render:
+                event[key] = render[key]
 
-        # Render the selected page
-        pages[app_mode]()
+        render_download_bundle()
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Deployments pick how aggregations are built with environment variables, e.g.
+#   PELOTONNES_BUILD_MODE=process PELOTONNES_BUILD_WORKERS=4
+BUILD_MODE_ENV = "PELOTONNES_BUILD_MODE"
+BUILD_WORKERS_ENV = "PELOTONNES_BUILD_WORKERS"
+BUILD_MODES = ["serial", "thread", "process"]
+
+# The numeric columns accumulate() reads. Each is shared with its own dtype (e.g.
+# whole-number calories stay int64), so workers accumulate the same frame as a
+# serial build.
+SHARED_COLUMNS = [
+    "c_duration",
+    "Distance (mi)",
+    "Total Output",
+    "Calories Burned",
+    "Avg. Heartrate",
+    "Avg. Speed (mph)",
+    "Avg. Cadence (RPM)",
+    "Avg. Resistance",
+]
+
+
+def build_mode():
+    mode = os.environ.get(BUILD_MODE_ENV, "thread").lower()
+    if mode not in BUILD_MODES:
+        raise ValueError("Unknown build mode: {}".format(mode))
+    return mode
+
+
+def build_workers():
+    return int(os.environ.get(BUILD_WORKERS_ENV, os.cpu_count() or 1))
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_build_executor(mode=None, workers=None):
+    # One pool per (mode, workers) for the whole process, shared by every session.
+    # Returns None for serial builds.
+    mode = mode or build_mode()
+    workers = workers or build_workers()
+    if mode == "serial" or workers <= 1:
+        return None
+    with _executors_lock:
+        executor = _executors.get((mode, workers))
+        if executor is None:
+            if mode == "thread":
+                executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="pelotonnes-build"
+                )
+            else:
+                # Forking a process that runs Streamlit's and the pools' threads
+                # can deadlock the children, so workers start from a clean server
+                executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                )
+            _executors[(mode, workers)] = executor
+    return executor
+
+
+class SharedArray(object):
+    # A numpy array copied into a shared memory block, which worker processes attach
+    # to by name instead of receiving a pickled copy
+    def __init__(self, array):
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)[:] = array
+        self.spec = (self._shm.name, self.shape, self.dtype)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def read_shared(spec, row=None):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        return (array if row is None else array[row]).copy()
+    finally:
+        shm.close()
+
+
+def _accumulate_shared(column_specs, codes_spec, row, metrics=None):
+    # Runs in a worker process. Groups are integer codes; -1 marks a missing key.
+    from aggregation import accumulate
+
+    workouts_df = pd.DataFrame(
+        {column: read_shared(spec) for column, spec in column_specs.items()}
+    )
+    codes = read_shared(codes_spec, row)
+    workouts_df["c_key"] = np.where(codes >= 0, codes, np.nan)
+    return accumulate(workouts_df, "c_key", metrics=metrics)
+
+
+def accumulate_in_processes(workouts_df, group_bys, executor, metrics=None):
+    # group_bys maps an aggregation name to its group-by column (None for all time).
+    # The numeric columns and the factorized keys go into shared memory once, and
+    # every aggregation is accumulated by a separate worker.
+    uniques = {}
+    codes = np.empty((len(group_bys), len(workouts_df)), dtype="int64")
+    for row, (name, group_by) in enumerate(group_bys.items()):
+        if group_by is None:
+            codes[row] = 0
+            uniques[name] = pd.Index(["All Time"])
+        else:
+            codes[row], uniques[name] = pd.factorize(workouts_df[group_by])
+
+    columns = {
+        column: SharedArray(workouts_df[column].to_numpy()) for column in SHARED_COLUMNS
+    }
+    column_specs = {column: shared.spec for column, shared in columns.items()}
+    shared_codes = SharedArray(codes)
+    try:
+        futures = {
+            name: executor.submit(
+                _accumulate_shared, column_specs, shared_codes.spec, row, metrics
+            )
+            for row, name in enumerate(group_bys)
+        }
+        accumulators = {}
+        for name, future in futures.items():
+            result = future.result()
+            result.index = uniques[name].take(result.index.astype("int64"))
+            # Sorted by key like a serial group-by, not in factorized order
+            accumulators[name] = result.sort_index()
+        return accumulators
+    finally:
+        for shared in columns.values():
+            shared.close()
+        shared_codes.close()
@@ -0,0 +1,115 @@
+import hashlib
+import pickle
+from collections import Counter
+
+import pandas as pd
+
+
+def fingerprint_value(value):
+    # A stable content hash for the kinds of values we feed into a Pipeline
+    hasher = hashlib.sha1()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        hasher.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        if isinstance(value, pd.DataFrame):
+            hasher.update(repr(list(value.columns)).encode("utf-8"))
+    elif isinstance(value, (bytes, bytearray)):
+        hasher.update(value)
+    else:
+        hasher.update(pickle.dumps(value))
+    return hasher.hexdigest()
+
+
+class Pipeline(object):
+    # A small DAG of named artifacts. Inputs are set explicitly, and every other
+    # node is memoized by the fingerprints of its dependencies, so changing one
+    # input only recomputes the nodes downstream of it.
+    def __init__(self):
+        self._nodes = {}
+        self._inputs = {}
+        self._cache = {}
+
+    def set_input(self, name, value, fingerprint=None):
+        if fingerprint is None:
+            fingerprint = fingerprint_value(value)
+        self._inputs[name] = (value, fingerprint)
+
+    def has_input(self, name):
+        return name in self._inputs
+
+    def add_node(self, name, function, deps=(), incremental=False):
+        # Incremental nodes are also passed their last value as `previous`, so they
+        # can extend it instead of starting from scratch
+        if name in self._inputs:
+            raise ValueError("{} is already an input".format(name))
+        self._nodes[name] = (function, tuple(deps), incremental)
+
+    def has_node(self, name):
+        return name in self._nodes
+
+    def derive(self, name, function, deps=(), incremental=False):
+        # Register the node on first use, then return its (possibly cached) value
+        if name not in self._nodes:
+            self.add_node(name, function, deps, incremental=incremental)
+        return self.get(name)
+
+    def fingerprint(self, name):
+        if name in self._inputs:
+            return self._inputs[name][1]
+        _, deps, _ = self._node(name)
+        hasher = hashlib.sha1(name.encode("utf-8"))
+        for dep in deps:
+            hasher.update(self.fingerprint(dep).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def get(self, name):
+        if name in self._inputs:
+            return self._inputs[name][0]
+
+        function, deps, incremental = self._node(name)
+        fingerprint = self.fingerprint(name)
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        kwargs = {}
+        if incremental:
+            kwargs["previous"] = cached[1] if cached is not None else None
+        value = function(*[self.get(dep) for dep in deps], **kwargs)
+        self._cache[name] = (fingerprint, value)
+        return value
+
+    def get_many(self, names, executor=None):
+        # Compute several artifacts, in parallel when given an executor. Ancestors
+        # shared by more than one of them are resolved first, so the concurrent part
+        # only ever touches disjoint chains of nodes.
+        if executor is None:
+            return {name: self.get(name) for name in names}
+
+        counts = Counter(
+            ancestor for name in names for ancestor in self._ancestors(name)
+        )
+        for ancestor, count in counts.items():
+            if count > 1:
+                self.get(ancestor)
+
+        futures = {name: executor.submit(self.get, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _ancestors(self, name):
+        ancestors = set()
+        stack = [name]
+        while stack:
+            current = stack.pop()
+            if current in self._inputs:
+                continue
+            for dep in self._node(current)[1]:
+                if dep not in ancestors:
+                    ancestors.add(dep)
+                    stack.append(dep)
+        return ancestors
+
+    def _node(self, name):
+        try:
+            return self._nodes[name]
+        except KeyError:
+            raise KeyError("Unknown pipeline artifact: {}".format(name))
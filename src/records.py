@@ -0,0 +1,122 @@
+from bisect import insort
+
+import pandas as pd
+
+# The groupings records are kept for, keyed by the column that defines the group
+RECORD_GROUPS = {
+    "All Time": None,
+    "Instructor": "Instructor Name",
+    "Class Type": "Type",
+    "Class Length": "Length (minutes)",
+}
+
+# Per-workout values that can be ranked
+RECORD_METRICS = {
+    "Total Output": lambda df: df["Total Output"],
+    "Avg. Output (watts)": lambda df: (100.0 / 6.0)
+    * df["Total Output"]
+    / df["c_duration"],
+    "Calories Burned": lambda df: df["Calories Burned"],
+    "Distance (mi)": lambda df: df["Distance (mi)"],
+}
+
+# What is shown alongside the value for each record
+RECORD_COLUMNS = ["Workout Timestamp", "Instructor Name", "Title", "Type"]
+
+
+def workout_ids(workouts_df):
+    # A workout is identified by when it started and what was ridden
+    return workouts_df["Workout Timestamp"].astype(str) + "|" + workouts_df["Title"]
+
+
+class TopK(object):
+    # The k largest (value, record) pairs, kept in ascending order so that inserts
+    # are a bisect and reading the records back is O(k)
+    def __init__(self, k):
+        self.k = k
+        self._entries = []
+        self._counter = 0
+
+    def push(self, value, record):
+        if len(self._entries) == self.k and value <= self._entries[0][0]:
+            return
+        # The counter breaks ties so records themselves are never compared
+        self._counter += 1
+        insort(self._entries, (value, -self._counter, record))
+        if len(self._entries) > self.k:
+            self._entries.pop(0)
+
+    def top(self, n=None):
+        entries = self._entries[::-1]
+        if n is not None:
+            entries = entries[:n]
+        return [(value, record) for value, _, record in entries]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RecordsIndex(object):
+    def __init__(self, k=10):
+        self.k = k
+        self.seen_ids = set()
+        self._top = {}
+
+    def update(self, workouts_df):
+        # Only rows we haven't indexed yet are scanned, so re-uploading a newer
+        # export of the same account costs one pass over the new workouts
+        ids = workout_ids(workouts_df)
+        new_rows = ~ids.isin(self.seen_ids)
+        workouts_df = workouts_df[new_rows]
+        self.seen_ids.update(ids[new_rows])
+
+        records = workouts_df[RECORD_COLUMNS].to_dict("records")
+        for metric, metric_values in RECORD_METRICS.items():
+            values = metric_values(workouts_df).tolist()
+            for group, group_by in RECORD_GROUPS.items():
+                if group_by is None:
+                    keys = ["All Time"] * len(workouts_df)
+                else:
+                    keys = workouts_df[group_by].tolist()
+                for key, value, record in zip(keys, values, records):
+                    if pd.isna(key) or pd.isna(value):
+                        continue
+                    top_k = self._top.get((group, key, metric))
+                    if top_k is None:
+                        top_k = TopK(self.k)
+                        self._top[(group, key, metric)] = top_k
+                    top_k.push(value, record)
+        return self
+
+    def keys(self, group):
+        return sorted({key for g, key, _ in self._top if g == group})
+
+    def metrics(self):
+        # The metrics with at least one record, e.g. no output for running
+        ranked = {metric for _, _, metric in self._top}
+        return [metric for metric in RECORD_METRICS if metric in ranked]
+
+    def top(self, group, key, metric, n=None):
+        top_k = self._top.get((group, key, metric))
+        if top_k is None:
+            return []
+        return top_k.top(n)
+
+    def top_df(self, group, key, metric, n=None):
+        return pd.DataFrame(
+            [
+                dict(record, **{metric: value})
+                for value, record in self.top(group, key, metric, n)
+            ],
+            columns=RECORD_COLUMNS + [metric],
+        )
+
+
+def update_records_index(workouts_df, previous=None, k=10):
+    # Extend the previous index when the new frame only adds workouts, otherwise
+    # start over (e.g. a different rider's export was uploaded)
+    if previous is None or not previous.seen_ids.issubset(
+        set(workout_ids(workouts_df))
+    ):
+        previous = RecordsIndex(k=k)
+    return previous.update(workouts_df)
@@ -0,0 +1,95 @@
+import streamlit as st
+import plotly.express as px
+
+from aggregation import NO_CLASS_TYPE, NO_INSTRUCTOR, slice_activity_cube
+from render_stats_by_time import render_figure_grid
+
+WEEKDAYS = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+HEATMAP_METRICS = [
+    "Total Workouts",
+    "Total Minutes",
+    "Total Output",
+    "Avg. Output (watts)",
+    "Avg. Calories per Minute",
+    "Avg. Heartrate",
+    "Avg. Cadence (RPM)",
+    "Avg. Resistance",
+]
+ALL = "All"
+
+
+def build_activity_heatmap(aggregation, metric):
+    heatmap_df = aggregation.aggregated_df[metric].unstack("c_hour")
+    heatmap_df.index = [WEEKDAYS[weekday] for weekday in heatmap_df.index]
+    fig = px.imshow(
+        heatmap_df,
+        title="{} by Day of Week and Hour of Day".format(metric),
+        labels={"x": "Hour of Day", "y": "Day of Week", "color": metric},
+        aspect="auto",
+    )
+    fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+    return fig
+
+
+def build_activity_heatmaps(aggregation):
+    return {
+        metric: build_activity_heatmap(aggregation, metric)
+        for metric in HEATMAP_METRICS
+        if metric in aggregation.aggregated_df.columns
+    }
+
+
+def render_activity_by_hour():
+    st.title("Stats By Day & Hour")
+
+    pipeline = st.session_state.get("workouts_pipeline", None)
+    if pipeline is None:
+        st.markdown(
+            "Workouts have not been uploaded. See 'Upload Workouts' to the left."
+        )
+        return
+
+    st.markdown(
+        "When do you ride, and when do you ride best? Times are in the local time "
+        + "zone of each workout."
+    )
+
+    cube = pipeline.get("activity_cube")
+    instructors = cube.index.get_level_values("Instructor Name").unique()
+    class_types = cube.index.get_level_values("Type").unique()
+
+    c1, c2 = st.columns(2)
+    with c1:
+        instructor = st.selectbox(
+            "Instructor",
+            options=[ALL] + sorted(i for i in instructors if i != NO_INSTRUCTOR),
+        )
+    with c2:
+        class_type = st.selectbox(
+            "Class Type",
+            options=[ALL] + sorted(t for t in class_types if t != NO_CLASS_TYPE),
+        )
+
+    # Slices come from the cube; the workouts themselves are never rescanned
+    pipeline.set_input("activity_instructor", None if instructor == ALL else instructor)
+    pipeline.set_input("activity_class_type", None if class_type == ALL else class_type)
+    if not pipeline.has_node("activity_heatmaps"):
+        pipeline.add_node(
+            "activity_slice",
+            slice_activity_cube,
+            ["activity_cube", "activity_instructor", "activity_class_type"],
+        )
+        pipeline.add_node(
+            "activity_heatmaps", build_activity_heatmaps, ["activity_slice"]
+        )
+    heatmaps = pipeline.get("activity_heatmaps")
+
+    render_figure_grid(heatmaps, [(metric,) for metric in HEATMAP_METRICS])
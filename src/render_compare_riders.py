@@ -0,0 +1,88 @@
+from functools import partial
+
+import streamlit as st
+import plotly.express as px
+
+from pipeline import Pipeline
+from riders import COMPARISON_DIMENSIONS, compare_riders, load_riders
+from schema import UnsupportedExportError
+
+TIME_DIMENSIONS = ["Year", "Month", "Week"]
+
+
+def build_comparison_figure(aggregation, metric, dimension):
+    comparison_df = aggregation.aggregated_df[metric].unstack("Rider")
+    if dimension in TIME_DIMENSIONS:
+        fig = px.line(
+            comparison_df,
+            title="{} per {}".format(metric, dimension),
+            labels={"index": dimension, "value": metric},
+        )
+    else:
+        fig = px.bar(
+            comparison_df,
+            title="{} by {}".format(metric, dimension),
+            labels={"index": dimension, "value": metric},
+            barmode="group",
+        )
+    fig.update_xaxes(showgrid=False)
+    fig.update_yaxes(showgrid=False)
+    fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+    return fig
+
+
+def render_compare_riders():
+    st.title("Compare Riders")
+    st.markdown(
+        "Upload a workouts.csv for each rider you want to compare. Riders are named "
+        + "after their file."
+    )
+
+    rider_uploads = st.file_uploader(
+        "Upload workouts",
+        type=["csv"],
+        accept_multiple_files=True,
+    )
+    if not rider_uploads:
+        return
+
+    pipeline = st.session_state.get("riders_pipeline", None)
+    if pipeline is None:
+        pipeline = Pipeline()
+        pipeline.add_node("riders_df", load_riders, ["rider_uploads"])
+        for dimension, group_by in COMPARISON_DIMENSIONS.items():
+            pipeline.add_node(
+                "comparison/" + dimension,
+                partial(compare_riders, group_by=group_by),
+                ["riders_df"],
+            )
+        st.session_state["riders_pipeline"] = pipeline
+
+    # Fingerprinted by content, so reruns with the same files reuse everything
+    pipeline.set_input(
+        "rider_uploads", [(upload.name, upload.getvalue()) for upload in rider_uploads]
+    )
+    try:
+        riders_df = pipeline.get("riders_df")
+    except UnsupportedExportError as e:
+        st.error(str(e))
+        return
+
+    st.markdown(
+        "Comparing **{}** riders over **{}** workouts.".format(
+            len(riders_df["Rider"].cat.categories), len(riders_df)
+        )
+    )
+
+    c1, c2 = st.columns(2)
+    with c1:
+        dimension = st.selectbox("Compare by", options=list(COMPARISON_DIMENSIONS))
+    aggregation = pipeline.get("comparison/" + dimension)
+    with c2:
+        metric = st.selectbox("Metric", options=list(aggregation.aggregated_df.columns))
+
+    st.dataframe(aggregation.aggregated_df[metric].unstack("Rider"))
+    st.plotly_chart(
+        build_comparison_figure(aggregation, metric, dimension),
+        use_container_width=True,
+    )
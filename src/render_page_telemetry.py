@@ -0,0 +1,64 @@
+import plotly.express as px
+import streamlit as st
+
+from telemetry import get_telemetry
+
+HISTOGRAMS = {
+    "Payload (bytes)": "payload_bytes",
+    "Elements": "n_elements",
+    "Render time (ms)": "render_ms",
+}
+
+
+def build_histogram_figure(histogram, title):
+    counts = histogram.to_series()
+    # Drop the empty buckets at either end so the bars are readable
+    nonzero = counts.to_numpy().nonzero()[0]
+    if len(nonzero):
+        first, last = nonzero[0], nonzero[-1] + 1
+        counts = counts.iloc[first:last]
+    fig = px.bar(
+        x=counts.index,
+        y=counts.values,
+        labels={"x": title, "y": "Renders"},
+        title=title,
+    )
+    fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+    return fig
+
+
+def render_page_telemetry():
+    st.title("Page Telemetry")
+
+    telemetry = get_telemetry()
+    pages = telemetry.pages()
+    if not pages:
+        st.markdown(
+            "No page renders have been measured yet. Set PELOTONNES_TELEMETRY=on "
+            + "and visit a few pages."
+        )
+        return
+
+    st.markdown(
+        "Payload size, element count and server-side render time of every measured "
+        + "page render in this process, across all sessions."
+    )
+    st.dataframe(telemetry.summary_df())
+
+    page = st.selectbox("Page", options=sorted(pages))
+    stats = pages[page]
+    if stats.element_bytes:
+        st.markdown(
+            "Average bytes per render by element type: "
+            + ", ".join(
+                "{} {:.1f}KB".format(kind, n_bytes / 1024.0 / stats.payload_bytes.n)
+                for kind, n_bytes in sorted(stats.element_bytes.items())
+            )
+        )
+    columns = st.columns(len(HISTOGRAMS))
+    for column, (title, attribute) in zip(columns, HISTOGRAMS.items()):
+        with column:
+            st.plotly_chart(
+                build_histogram_figure(getattr(stats, attribute), title),
+                use_container_width=True,
+            )
@@ -0,0 +1,48 @@
+import pandas as pd
+import streamlit as st
+
+from records import RECORD_GROUPS
+
+
+def render_top_rides(records, group, key, metric=None):
+    if metric is None:
+        metric = st.selectbox(
+            "Rank by", options=records.metrics(), key="top_rides_metric"
+        )
+    if metric is None:
+        return
+    st.dataframe(records.top_df(group, key, metric))
+
+
+def render_personal_records():
+    st.title("Personal Records")
+
+    pipeline = st.session_state.get("workouts_pipeline", None)
+    if pipeline is None:
+        st.markdown(
+            "Workouts have not been uploaded. See 'Upload Workouts' to the left."
+        )
+        return
+
+    records = pipeline.get("records")
+
+    if "Total Output" in records.metrics():
+        st.subheader("Best Output by Class Length")
+        best_by_length = []
+        for length in records.keys("Class Length"):
+            for value, record in records.top("Class Length", length, "Total Output", 1):
+                best_by_length.append(
+                    dict(record, **{"Class Length": length, "Total Output": value})
+                )
+        st.dataframe(pd.DataFrame(best_by_length))
+
+    st.subheader("Top Rides")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        group = st.selectbox("Records by", options=list(RECORD_GROUPS))
+    with c2:
+        key = st.selectbox(group, options=records.keys(group))
+    with c3:
+        metric = st.selectbox("Metric", options=records.metrics())
+    if metric is not None:
+        render_top_rides(records, group, key, metric)
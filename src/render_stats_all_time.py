@@ -1,48 +1,67 @@
 import streamlit as st
 
+# How the summary describes the time spent and the distance covered, by discipline
+DISTANCE_VERBS = {
+    "Cycling": ("cycled", "rode"),
+    "Running": ("run", "ran"),
+    "Walking": ("walked", "walked"),
+}
+
 
 def render_stats_all_time():
     st.title("All-Time Stats")
 
-    if "workouts_df" not in st.session_state:
+    pipeline = st.session_state.get("workouts_pipeline", None)
+    if pipeline is None:
         st.markdown(
             "Workouts have not been uploaded. See 'Upload Workouts' to the left."
         )
         return
 
-    workouts_df = st.session_state["workouts_df"]
-    all_time_df = st.session_state["workouts_aggregation_all_time"].aggregated_df
+    summary = pipeline.get("summary")
+    discipline = st.session_state.get("discipline", "Cycling")
 
-    st.dataframe(st.session_state["workouts_aggregation_all_time"].styled_aggregated_df)
+    st.dataframe(pipeline.get("styled/all_time"))
 
-    n_workouts = all_time_df["Total Workouts"].sum()
-    n_instructors = len(
-        st.session_state["workouts_aggregation_by_instructor"].aggregated_df
-    )
-    n_live = len(workouts_df[workouts_df["Live/On-Demand"] == "Live"])
-    n_on_demand = len(workouts_df[workouts_df["Live/On-Demand"] == "On Demand"])
+    n_workouts = summary["n_workouts"]
+    n_instructors = summary["n_instructors"]
+    n_live = summary["n_live"]
+    n_on_demand = summary["n_on_demand"]
     st.markdown(
-        f"You have completed **{n_workouts}** cycling workouts"
+        f"You have completed **{n_workouts}** {discipline.lower()} workouts"
         + f" with **{n_instructors}** different instructors. "
         + f"You have completed **{n_live}** live workouts and **{n_on_demand}** "
         + "on-demand workouts."
     )
 
-    total_mins = all_time_df["Total Minutes"].sum()
+    total_mins = summary["total_minutes"]
     total_hrs = total_mins / 60
     total_days = total_hrs / 24
-    total_miles = all_time_df["Total Distance"].sum()
+    if "total_distance" not in summary or "avg_speed" not in summary:
+        st.markdown(
+            (
+                "You have worked out for **{:.0f}** minutes (that's **{:.2f}** hours, "
+                + "or **{:.2f}** whole days)."
+            ).format(total_mins, total_hrs, total_days)
+        )
+        render_energy_totals(summary)
+        return
+
+    total_miles = summary["total_distance"]
+    time_verb, distance_verb = DISTANCE_VERBS.get(discipline, ("worked out", "covered"))
     st.markdown(
         (
-            "You have cycled for **{:.0f}** minutes (that's **{:.2f}** hours, or "
-            + "**{:.2f}** whole days) and rode **{:.2f}** miles in that time at an"
+            "You have {} for **{:.0f}** minutes (that's **{:.2f}** hours, or "
+            + "**{:.2f}** whole days) and {} **{:.2f}** miles in that time at an"
             + " all-time average speed of **{:.2f}** mph."
         ).format(
+            time_verb,
             total_mins,
             total_hrs,
             total_days,
+            distance_verb,
             total_miles,
-            all_time_df["Avg. Speed (mph)"].mean(),
+            summary["avg_speed"],
         )
     )
 
@@ -68,8 +87,23 @@ def render_stats_all_time():
         )
     )
 
-    total_output = all_time_df["Total Output"].sum()
-    total_calories = all_time_df["Total Calories"].sum()
+    render_energy_totals(summary)
+
+
+def render_energy_totals(summary):
+    total_calories = summary["total_calories"]
+    total_lbs_of_fat = total_calories / 3500
+    if "total_output" not in summary:
+        st.markdown(
+            (
+                "You've burned a total of **{:.0f}** kilocalories in that time. "
+                + "That's approximately **{:.2f}** pounds of pure body fat."
+            ).format(total_calories, total_lbs_of_fat)
+        )
+        st.markdown("**Keep it up!**")
+        return
+
+    total_output = summary["total_output"]
     st.markdown(
         (
             "You've output a total of **{:.0f}** kilojoules and burned a total of"
@@ -78,7 +112,6 @@ def render_stats_all_time():
     )
 
     total_iphone_years = total_output / 35.6
-    total_lbs_of_fat = total_calories / 3500
     total_kg_to_orbit = total_output / 63000
     total_home_days = total_output / 105682
     st.markdown(
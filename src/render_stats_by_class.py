@@ -1,19 +1,215 @@
+from functools import partial
+
+import numpy as np
 import streamlit as st
 import plotly.express as px
+import plotly.graph_objects as go
+
+from aggregation import SKETCH_METRICS
+
+from render_personal_records import render_top_rides
+from render_stats_by_time import render_figure_grid
+
+# (column, axis label, affected by the log scale option, drop missing values)
+AVERAGE_BAR_CHARTS = [
+    ("Avg. Output (watts)", "Avg. Output (watts)", False, False),
+    ("Avg. Calories per Minute", "Avg. Calories per Minute", False, False),
+    ("Avg. Speed (mph)", "Avg. Speed (mph)", True, True),
+    ("Avg. Heartrate", "Avg. Heartrate", False, True),
+    ("Avg. Resistance", "Avg. Resistance (%)", True, True),
+    ("Avg. Cadence (RPM)", "Avg. Cadence (RPM)", True, True),
+]
+TOTAL_BAR_CHARTS = [
+    ("Total Minutes", "Total Minutes", True, False),
+    ("Total Workouts", "Total Workouts", True, True),
+    ("Total Output", "Total Output", True, True),
+    ("Total Calories", "Total Calories", True, True),
+    ("Total Distance", "Total Distance", True, True),
+]
+
+
+def class_scatter_text(aggregation, readable_class_characteristic):
+    # When slicing by Instructor, this helps visualize without as much crowding
+    scatter_text = aggregation.aggregated_df.index.to_series()
+    if readable_class_characteristic == "Instructor":
+        scatter_text = scatter_text.apply(lambda x: x.split(" ")[0])
+    return scatter_text
+
+
+def has_columns(aggregation, *columns):
+    return all(column in aggregation.aggregated_df.columns for column in columns)
+
+
+def build_class_scatter_figure(
+    aggregation, x, y, readable_class_characteristic, title=None, log_x=False
+):
+    fig = px.scatter(
+        aggregation.aggregated_df,
+        title=title,
+        x=x,
+        y=y,
+        text=class_scatter_text(aggregation, readable_class_characteristic),
+        log_x=log_x,
+    )
+    fig.update_xaxes(showgrid=False)
+    fig.update_yaxes(showgrid=False)
+    fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+    fig.update_traces(textposition="top center", marker_size=20)
+    return fig
+
+
+def build_class_bar_figure(
+    aggregation, column, label, readable_class_characteristic, log_y, dropna
+):
+    sorted_values = aggregation.aggregated_df[column].sort_values(ascending=False)
+    if dropna:
+        sorted_values = sorted_values.dropna()
+    fig = px.bar(
+        sorted_values,
+        title="{} by {}".format(label, readable_class_characteristic),
+        labels={
+            "index": readable_class_characteristic,
+            "value": label,
+        },
+        log_y=log_y,
+    )
+    fig.update_xaxes(showgrid=False)
+    fig.update_yaxes(showgrid=False)
+    fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+    fig.update_layout(showlegend=False)
+    return fig
+
+
+def build_class_figures(aggregation, readable_class_characteristic):
+    # The figures that do not depend on the log scale option. Figures of columns
+    # the discipline doesn't track are skipped.
+    figures = {}
+    if has_columns(aggregation, "Avg. Cadence (RPM)", "Avg. Resistance"):
+        figures["Resistance vs Cadence"] = build_class_scatter_figure(
+            aggregation,
+            "Avg. Cadence (RPM)",
+            "Avg. Resistance",
+            readable_class_characteristic,
+        )
+    for column, label, log_scaled, dropna in AVERAGE_BAR_CHARTS + TOTAL_BAR_CHARTS:
+        if not log_scaled and has_columns(aggregation, column):
+            figures[column] = build_class_bar_figure(
+                aggregation, column, label, readable_class_characteristic, False, dropna
+            )
+    return figures
+
+
+def build_log_scale_class_figures(
+    aggregation, log_scale, readable_class_characteristic
+):
+    figures = {}
+    if has_columns(aggregation, "Avg. Output (watts)"):
+        figures["Output vs Minutes"] = build_class_scatter_figure(
+            aggregation,
+            "Total Minutes",
+            "Avg. Output (watts)",
+            readable_class_characteristic,
+            log_x=log_scale,
+        )
+    if has_columns(aggregation, "Avg. Calories per Minute"):
+        figures["Calories vs Minutes"] = build_class_scatter_figure(
+            aggregation,
+            "Total Minutes",
+            "Avg. Calories per Minute",
+            readable_class_characteristic,
+            title="Avg. Calories per Minute vs Total Minutes",
+            log_x=log_scale,
+        )
+    if has_columns(aggregation, "Avg. Cadence (RPM)", "Avg. Calories per Minute"):
+        figures["Calories vs Cadence"] = build_class_scatter_figure(
+            aggregation,
+            "Avg. Cadence (RPM)",
+            "Avg. Calories per Minute",
+            readable_class_characteristic,
+            title="Avg. Calories per Minute vs Avg. Cadence (RPM)",
+            log_x=log_scale,
+        )
+    for column, label, log_scaled, dropna in AVERAGE_BAR_CHARTS + TOTAL_BAR_CHARTS:
+        if log_scaled and has_columns(aggregation, column):
+            figures[column] = build_class_bar_figure(
+                aggregation,
+                column,
+                label,
+                readable_class_characteristic,
+                log_scale,
+                dropna,
+            )
+    return figures
+
+
+def build_distribution_figure(sketches, metric, kind, readable_class_characteristic):
+    # Box whiskers are the 10th and 90th percentiles. Violins are drawn from evenly
+    # spaced quantiles of the sketch rather than the raw values.
+    keys = [key for key in sorted(sketches) if len(sketches[key][metric]) > 0]
+    fig = go.Figure()
+    if kind == "Box":
+        stats = np.array(
+            [
+                sketches[key][metric].quantiles([0.1, 0.25, 0.5, 0.75, 0.9])
+                for key in keys
+            ]
+        ).reshape(-1, 5)
+        fig.add_trace(
+            go.Box(
+                x=[str(key) for key in keys],
+                lowerfence=stats[:, 0],
+                q1=stats[:, 1],
+                median=stats[:, 2],
+                q3=stats[:, 3],
+                upperfence=stats[:, 4],
+                name=metric,
+            )
+        )
+    else:
+        for key in keys:
+            fig.add_trace(
+                go.Violin(
+                    y=sketches[key][metric].quantiles(np.linspace(0.0, 1.0, 51)),
+                    name=str(key),
+                    points=False,
+                )
+            )
+    fig.update_layout(
+        title="{} by {}".format(metric, readable_class_characteristic),
+        xaxis_title=readable_class_characteristic,
+        yaxis_title=metric,
+    )
+    fig.update_xaxes(showgrid=False)
+    fig.update_yaxes(showgrid=False)
+    fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+    fig.update_layout(showlegend=False)
+    return fig
 
-from aggregation import Aggregation
+
+def build_distribution_figures(sketches, kind, readable_class_characteristic):
+    sketched = {metric for group in sketches.values() for metric in group}
+    return {
+        metric: build_distribution_figure(
+            sketches, metric, kind, readable_class_characteristic
+        )
+        for metric in SKETCH_METRICS
+        if metric in sketched
+    }
 
 
-def render_stats_by_class(aggregation: Aggregation, readable_class_characteristic: str):
+def render_stats_by_class(
+    pipeline, aggregation_name, readable_class_characteristic: str
+):
     st.title("Stats By {}".format(readable_class_characteristic))
 
-    if aggregation is None:
+    if pipeline is None:
         st.markdown(
             "Workouts have not been uploaded. See 'Upload Workouts' to the left."
         )
         return
 
-    st.dataframe(aggregation.styled_aggregated_df)
+    aggregation = pipeline.get("aggregation/" + aggregation_name)
+    st.dataframe(pipeline.get("styled/" + aggregation_name))
 
     with st.expander("Visualization Options"):
         log_scale = st.checkbox(
@@ -29,362 +225,107 @@ def render_stats_by_class(aggregation: Aggregation, readable_class_characteristi
             + "types and very few workouts of other types."
         )
 
-    # When slicing by Instructor, this helps visualize without as much crowding
-    scatter_text = aggregation.aggregated_df.index.to_series()
-    if readable_class_characteristic == "Instructor":
-        scatter_text = scatter_text.apply(lambda x: x.split(" ")[0])
+    # Toggling the log scale only rebuilds the figures that use it
+    pipeline.set_input("log_scale/" + aggregation_name, log_scale)
+    figures = pipeline.derive(
+        "figures/" + aggregation_name,
+        partial(
+            build_class_figures,
+            readable_class_characteristic=readable_class_characteristic,
+        ),
+        ["aggregation/" + aggregation_name],
+    )
+    figures = dict(figures)
+    figures.update(
+        pipeline.derive(
+            "log_scale_figures/" + aggregation_name,
+            partial(
+                build_log_scale_class_figures,
+                readable_class_characteristic=readable_class_characteristic,
+            ),
+            ["aggregation/" + aggregation_name, "log_scale/" + aggregation_name],
+        )
+    )
 
     with st.expander("Visualize Output and Performance", expanded=True):
 
-        c1, c2 = st.columns([3, 2])
-        with c1:
-            fig = px.scatter(
-                aggregation.aggregated_df,
-                x="Total Minutes",
-                y="Avg. Output (watts)",
-                text=scatter_text,
-                log_x=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)",
-                paper_bgcolor="rgba(0,0,0,0)",
-            )
-            fig.update_traces(textposition="top center", marker_size=20)
-            st.plotly_chart(fig, use_container_width=True)
-        with c2:
-            st.subheader("Avg. Output (watts) vs Total Minutes")
-            st.markdown(
-                "This plot shows which classes you spend the most time in vs how hard"
-                + " you work in those workouts. "
-            )
-            st.markdown(
-                "Classes in the top-left make you work hard, but you have not spent "
-                + "much time in them. Maybe try them out some more!"
-            )
+        if "Output vs Minutes" in figures:
+            c1, c2 = st.columns([3, 2])
+            with c1:
+                st.plotly_chart(figures["Output vs Minutes"], use_container_width=True)
+            with c2:
+                st.subheader("Avg. Output (watts) vs Total Minutes")
+                st.markdown(
+                    "This plot shows which classes you spend the most time in vs how "
+                    + "hard you work in those workouts. "
+                )
+                st.markdown(
+                    "Classes in the top-left make you work hard, but you have not "
+                    + "spent much time in them. Maybe try them out some more!"
+                )
 
-            st.markdown(
-                "Classes in the bottom-right are ones you spend a lot of time in, but "
-                + "don't push you as hard. You may want to phase these out of your "
-                + "routines."
-            )
+                st.markdown(
+                    "Classes in the bottom-right are ones you spend a lot of time in, "
+                    + "but don't push you as hard. You may want to phase these out of "
+                    + "your routines."
+                )
 
-        c1, c2 = st.columns([3, 2])
-        with c1:
-            fig = px.scatter(
-                aggregation.aggregated_df,
-                x="Avg. Cadence (RPM)",
-                y="Avg. Resistance",
-                text=scatter_text,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_traces(textposition="top center", marker_size=20)
-            st.plotly_chart(fig, use_container_width=True)
-        with c2:
-            st.subheader("Avg. Resistance (%) vs Avg. Cadence (RPM)")
-            st.markdown(
-                "This plot shows how hard you work in a class vs how fast you pedal "
-                + "in it."
-            )
-            st.markdown(
-                "Classes at the top-left get you pedaling slowly and working hard at a "
-                + "high resistance - good for putting the work in."
-            )
-            st.markdown(
-                "Classes at the bottom-right get you pedaling quickly but working at "
-                + "a low resistance - good for stretching your legs."
-            )
+        if "Resistance vs Cadence" in figures:
+            c1, c2 = st.columns([3, 2])
+            with c1:
+                st.plotly_chart(
+                    figures["Resistance vs Cadence"], use_container_width=True
+                )
+            with c2:
+                st.subheader("Avg. Resistance (%) vs Avg. Cadence (RPM)")
+                st.markdown(
+                    "This plot shows how hard you work in a class vs how fast you "
+                    + "pedal in it."
+                )
+                st.markdown(
+                    "Classes at the top-left get you pedaling slowly and working hard "
+                    + "at a high resistance - good for putting the work in."
+                )
+                st.markdown(
+                    "Classes at the bottom-right get you pedaling quickly but working "
+                    + "at a low resistance - good for stretching your legs."
+                )
 
-        c1, c2 = st.columns(2)
-        with c1:
-            fig = px.scatter(
-                aggregation.aggregated_df,
-                title="Avg. Calories per Minute vs Total Minutes",
-                x="Total Minutes",
-                y="Avg. Calories per Minute",
-                text=scatter_text,
-                log_x=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_traces(textposition="top center", marker_size=20)
-            st.plotly_chart(fig, use_container_width=True)
-        with c2:
-            fig = px.scatter(
-                aggregation.aggregated_df,
-                title="Avg. Calories per Minute vs Avg. Cadence (RPM)",
-                x="Avg. Cadence (RPM)",
-                y="Avg. Calories per Minute",
-                text=scatter_text,
-                log_x=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_traces(textposition="top center", marker_size=20)
-            st.plotly_chart(fig, use_container_width=True)
+        render_figure_grid(
+            figures, [("Calories vs Minutes",), ("Calories vs Cadence",)]
+        )
 
-        c1, c2 = st.columns(2)
-        with c1:
-            sorted_opm = aggregation.aggregated_df["Avg. Output (watts)"].sort_values(
-                ascending=False
-            )
-            fig = px.bar(
-                sorted_opm,
-                title="Avg. Output (watts) by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Avg. Output (watts)",
-                },
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            sorted_cpm = aggregation.aggregated_df[
-                "Avg. Calories per Minute"
-            ].sort_values(ascending=False)
-            fig = px.bar(
-                sorted_cpm,
-                title="Avg. Calories per Minute by {}".format(
-                    readable_class_characteristic
-                ),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Avg. Calories per Minute",
-                },
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        c1, c2 = st.columns(2)
-        with c1:
-            sorted_distance = (
-                aggregation.aggregated_df["Avg. Speed (mph)"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_distance,
-                title="Avg. Speed (mph) by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Avg. Speed (mph)",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            sorted_calories = (
-                aggregation.aggregated_df["Avg. Heartrate"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_calories,
-                title="Avg. Heartrate by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Avg. Heartrate",
-                },
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        c1, c2 = st.columns(2)
-        with c1:
-            sorted_resistance = (
-                aggregation.aggregated_df["Avg. Resistance"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_resistance,
-                title="Avg. Resistance (%) by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Avg. Resistance (%)",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-        with c2:
-            sorted_cadence = (
-                aggregation.aggregated_df["Avg. Cadence (RPM)"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_cadence,
-                title="Avg. Cadence (RPM) by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Avg. Cadence (RPM)",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
+        render_figure_grid(figures, AVERAGE_BAR_CHARTS)
 
     with st.expander("Visualize Totals", expanded=True):
+        render_figure_grid(figures, TOTAL_BAR_CHARTS)
 
-        c1, c2 = st.columns(2)
-        with c1:
-            sorted_minutes = aggregation.aggregated_df["Total Minutes"].sort_values(
-                ascending=False
-            )
-            fig = px.bar(
-                sorted_minutes,
-                title="Total Minutes by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Total Minutes",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            sorted_workouts = (
-                aggregation.aggregated_df["Total Workouts"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_workouts,
-                title="Total Workouts by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Total Workouts",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        c1, c2 = st.columns(2)
-        with c1:
-            sorted_output = (
-                aggregation.aggregated_df["Total Output"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_output,
-                title="Total Output by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Total Output",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            sorted_calories = (
-                aggregation.aggregated_df["Total Calories"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_calories,
-                title="Total Calories by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Total Calories",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        c1, c2 = st.columns(2)
-        with c1:
-            sorted_distance = (
-                aggregation.aggregated_df["Total Distance"]
-                .sort_values(ascending=False)
-                .dropna()
-            )
-            fig = px.bar(
-                sorted_distance,
-                title="Total Distance by {}".format(readable_class_characteristic),
-                labels={
-                    "index": readable_class_characteristic,
-                    "value": "Total Distance",
-                },
-                log_y=log_scale,
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-        with c2:
-            st.empty()
+    with st.expander("Visualize Distributions", expanded=True):
+        distribution_kind = st.radio("Plot type", options=["Box", "Violin"])
+        st.markdown(
+            "Boxes span the middle half of your workouts and the whiskers reach the "
+            + "10th and 90th percentiles."
+        )
+        pipeline.set_input("distribution_kind/" + aggregation_name, distribution_kind)
+        distribution_figures = pipeline.derive(
+            "distribution_figures/" + aggregation_name,
+            partial(
+                build_distribution_figures,
+                readable_class_characteristic=readable_class_characteristic,
+            ),
+            [
+                "sketches/" + aggregation_name,
+                "distribution_kind/" + aggregation_name,
+            ],
+        )
+        render_figure_grid(
+            distribution_figures, [(metric,) for metric in distribution_figures]
+        )
+
+    with st.expander("Top Rides"):
+        records = pipeline.get("records")
+        key = st.selectbox(
+            readable_class_characteristic,
+            options=records.keys(readable_class_characteristic),
+        )
+        render_top_rides(records, readable_class_characteristic, key)
@@ -1,17 +1,118 @@
+import datetime
+from functools import partial
+
 import streamlit as st
 import plotly.express as px
 
+from aggregation import AGGREGATIONS, SKETCH_METRICS, bucket_keys
+
+# (column, axis label) for each line chart, in display order
+AVERAGE_COLUMNS = [
+    ("Avg. Resistance", "Avg. Resistance (%)"),
+    ("Avg. Cadence (RPM)", "Avg. Cadence (RPM)"),
+    ("Avg. Speed (mph)", "Avg. Speed (mph)"),
+    ("Avg. Output (watts)", "Avg. Output (watts)"),
+    ("Avg. Heartrate", "Avg. Heartrate"),
+]
+TOTAL_COLUMNS = [
+    ("Total Minutes", "Total Minutes"),
+    ("Total Output", "Total Output"),
+    ("Total Calories", "Total Calories"),
+    ("Total Distance", "Total Distance"),
+    ("Total Workouts", "Total Workouts"),
+]
+
+
+def build_time_line_figure(aggregation, column, label, title, readable_time_unit):
+    fig = px.line(
+        aggregation.aggregated_df[column].dropna(),
+        title=title,
+        labels={"index": f"{readable_time_unit}", "value": label},
+    )
+    fig.update_xaxes(showgrid=False)
+    fig.update_yaxes(showgrid=False)
+    fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+    fig.update_layout(showlegend=False)
+    return fig
+
+
+def build_time_figures(aggregation, window, readable_time_unit):
+    aggregation = aggregation.densified(*window)
+    columns = aggregation.aggregated_df.columns
+    figures = {}
+    for column, label in AVERAGE_COLUMNS:
+        if column not in columns:
+            continue
+        figures[column] = build_time_line_figure(
+            aggregation,
+            column,
+            label,
+            "{} by {}".format(label, readable_time_unit),
+            readable_time_unit,
+        )
+    for column, label in TOTAL_COLUMNS:
+        if column not in columns:
+            continue
+        figures[column] = build_time_line_figure(
+            aggregation,
+            column,
+            label,
+            "{} per {}".format(label, readable_time_unit),
+            readable_time_unit,
+        )
+    return figures
+
+
+def build_time_quantile_figures(
+    quantiles_df, window, index_function, readable_time_unit
+):
+    # Only the buckets inside the chart window, like the other time charts
+    quantiles_df = quantiles_df[
+        quantiles_df.index.isin(bucket_keys(index_function, *window))
+    ]
+    figures = {}
+    for metric in SKETCH_METRICS:
+        columns = ["{} {}".format(metric, label) for label in ["p10", "p50", "p90"]]
+        if not all(column in quantiles_df.columns for column in columns):
+            continue
+        fig = px.line(
+            quantiles_df[columns].dropna(how="all"),
+            title="{} p10 / p50 / p90 by {}".format(metric, readable_time_unit),
+            labels={"index": f"{readable_time_unit}", "value": metric},
+        )
+        fig.update_xaxes(showgrid=False)
+        fig.update_yaxes(showgrid=False)
+        fig.update_layout(plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
+        figures[metric] = fig
+    return figures
+
+
+def render_figure_grid(figures, columns):
+    # Lay the figures out two to a row, leaving an empty cell on odd counts. Columns
+    # without a figure (e.g. metrics the discipline doesn't track) are skipped.
+    columns = [column for column in columns if column[0] in figures]
+    for i in range(0, len(columns), 2):
+        c1, c2 = st.columns(2)
+        with c1:
+            st.plotly_chart(figures[columns[i][0]], use_container_width=True)
+        with c2:
+            if i + 1 < len(columns):
+                st.plotly_chart(figures[columns[i + 1][0]], use_container_width=True)
+            else:
+                st.empty()
+
 
-def render_stats_by_time(aggregation, readable_time_unit):
+def render_stats_by_time(pipeline, aggregation_name, readable_time_unit):
     st.title(f"Stats By {readable_time_unit}")
 
-    if aggregation is None:
+    if pipeline is None:
         st.markdown(
             "Workouts have not been uploaded. See 'Upload Workouts' to the left."
         )
         return
 
-    st.dataframe(aggregation.styled_aggregated_df)
+    aggregation = pipeline.get("aggregation/" + aggregation_name)
+    st.dataframe(pipeline.get("styled/" + aggregation_name))
 
     n_workouts = len(aggregation.aggregated_df)
     if n_workouts < 2:
@@ -21,165 +122,39 @@ def render_stats_by_time(aggregation, readable_time_unit):
         st.markdown("Keep cycling and come back soon for more graphs!")
         return
 
-    with st.expander("Visualize Averages", expanded=True):
-        c1, c2 = st.columns(2)
-        with c1:
-            fig = px.line(
-                aggregation.aggregated_df["Avg. Resistance"].dropna(),
-                title="Avg. Resistance (%) by {}".format(readable_time_unit),
-                labels={
-                    "index": f"{readable_time_unit}",
-                    "value": "Avg. Resistance (%)",
-                },
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            fig = px.line(
-                aggregation.aggregated_df["Avg. Cadence (RPM)"].dropna(),
-                title="Avg. Cadence (RPM) by {}".format(readable_time_unit),
-                labels={
-                    "index": f"{readable_time_unit}",
-                    "value": "Avg. Cadence (RPM)",
-                },
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
+    # Only the visible window is densified, so empty buckets cost nothing until they
+    # are on screen
+    first_day, last_day = aggregation.day_span
+    default_start = first_day
+    if readable_time_unit == "Day":
+        default_start = max(first_day, last_day - datetime.timedelta(days=365))
+    window = st.slider(
+        "Chart window",
+        min_value=first_day,
+        max_value=last_day,
+        value=(default_start, last_day),
+    )
+    pipeline.set_input("window/" + aggregation_name, tuple(window))
+    figures = pipeline.derive(
+        "figures/" + aggregation_name,
+        partial(build_time_figures, readable_time_unit=readable_time_unit),
+        ["aggregation/" + aggregation_name, "window/" + aggregation_name],
+    )
 
-        c1, c2 = st.columns(2)
-        with c1:
-            fig = px.line(
-                aggregation.aggregated_df["Avg. Speed (mph)"].dropna(),
-                title="Avg. Speed (mph) by {}".format(readable_time_unit),
-                labels={"index": f"{readable_time_unit}", "value": "Avg. Speed (mph)"},
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            fig = px.line(
-                aggregation.aggregated_df["Avg. Output (watts)"].dropna(),
-                title="Avg. Output (watts) by {}".format(readable_time_unit),
-                labels={
-                    "index": f"{readable_time_unit}",
-                    "value": "Avg. Output (watts)",
-                },
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        c1, c2 = st.columns(2)
-        with c1:
-            fig = px.line(
-                aggregation.aggregated_df["Avg. Heartrate"].dropna(),
-                title="Avg. Heartrate by {}".format(readable_time_unit),
-                labels={"index": f"{readable_time_unit}", "value": "Avg. Heartrate"},
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            st.empty()
+    with st.expander("Visualize Averages", expanded=True):
+        render_figure_grid(figures, AVERAGE_COLUMNS)
 
     with st.expander("Visualize Totals", expanded=True):
-        c1, c2 = st.columns(2)
-        with c1:
-            fig = px.line(
-                aggregation.aggregated_df["Total Minutes"].dropna(),
-                title="Total Minutes per {}".format(readable_time_unit),
-                labels={"index": f"{readable_time_unit}", "value": "Total Minutes"},
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            fig = px.line(
-                aggregation.aggregated_df["Total Output"].dropna(),
-                title="Total Output per {}".format(readable_time_unit),
-                labels={"index": f"{readable_time_unit}", "value": "Total Output"},
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        c1, c2 = st.columns(2)
-        with c1:
-            fig = px.line(
-                aggregation.aggregated_df["Total Calories"].dropna(),
-                title="Total Calories per {}".format(readable_time_unit),
-                labels={"index": f"{readable_time_unit}", "value": "Total Calories"},
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            fig = px.line(
-                aggregation.aggregated_df["Total Distance"].dropna(),
-                title="Total Distance per {}".format(readable_time_unit),
-                labels={"index": f"{readable_time_unit}", "value": "Total Distance"},
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        c1, c2 = st.columns(2)
-        with c1:
-            fig = px.line(
-                aggregation.aggregated_df["Total Workouts"].dropna(),
-                title="Total Workouts per {}".format(readable_time_unit),
-                labels={"index": f"{readable_time_unit}", "value": "Total Workouts"},
-            )
-            fig.update_xaxes(showgrid=False)
-            fig.update_yaxes(showgrid=False)
-            fig.update_layout(
-                plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-
-        with c2:
-            st.empty()
+        render_figure_grid(figures, TOTAL_COLUMNS)
+
+    quantile_figures = pipeline.derive(
+        "quantile_figures/" + aggregation_name,
+        partial(
+            build_time_quantile_figures,
+            index_function=AGGREGATIONS[aggregation_name][1],
+            readable_time_unit=readable_time_unit,
+        ),
+        ["quantiles/" + aggregation_name, "window/" + aggregation_name],
+    )
+    with st.expander("Visualize Distributions", expanded=True):
+        render_figure_grid(quantile_figures, [(metric,) for metric in quantile_figures])
@@ -0,0 +1,106 @@
+import io
+import logging
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+BUNDLE_FILE_NAME = "pelotonnes_stats.zip"
+
+# How many finished bundles are kept around, across all sessions
+MAX_CACHED_BUNDLES = 16
+
+logger = logging.getLogger("pelotonnes.report_bundle")
+
+
+def export_aggregated_df(name, aggregation):
+    # The aggregated frame with its index as a named first column, e.g.
+    # "by_class_length" -> "Class Length"
+    index_label = name.replace("by_", "").replace("_", " ").title()
+    return aggregation.aggregated_df.rename_axis(index_label).reset_index()
+
+
+def build_report_bundle(aggregations):
+    # aggregations maps a name like "by_instructor" to its Aggregation. Every table
+    # goes in as both CSV (for spreadsheets) and Parquet (for notebooks).
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for name, aggregation in aggregations.items():
+            # Time series are kept sparse in memory; exports get every bucket
+            if aggregation.index_function is not None:
+                aggregation = aggregation.densified()
+            aggregated_df = export_aggregated_df(name, aggregation)
+            bundle.writestr(name + ".csv", aggregated_df.to_csv(index=False))
+
+            parquet = io.BytesIO()
+            # Index values like dates and years are mixed types in object columns
+            aggregated_df.astype({aggregated_df.columns[0]: str}).to_parquet(
+                parquet, index=False
+            )
+            bundle.writestr(name + ".parquet", parquet.getvalue())
+    return buffer.getvalue()
+
+
+class ReportBundleBuilder(object):
+    # Builds bundles on a background thread so no rerun ever waits for one. Results
+    # are cached by upload fingerprint and shared between sessions.
+    def __init__(self, max_workers=1, max_cached=MAX_CACHED_BUNDLES):
+        self.max_cached = max_cached
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pelotonnes-bundle"
+        )
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fingerprint, aggregations):
+        with self._lock:
+            future = self._futures.get(fingerprint)
+            # A failed build isn't kept around; the next submit tries again
+            if future is not None and not _failed(future):
+                self._futures.move_to_end(fingerprint)
+                return future
+            future = self._executor.submit(build_report_bundle, aggregations)
+            future.add_done_callback(_log_failure)
+            self._futures[fingerprint] = future
+            while len(self._futures) > self.max_cached:
+                self._futures.popitem(last=False)
+            return future
+
+    def get(self, fingerprint):
+        # The finished bundle, or None while it is still being built or if the build
+        # failed
+        with self._lock:
+            future = self._futures.get(fingerprint)
+        if future is None or not future.done() or _failed(future):
+            return None
+        return future.result()
+
+    def failed(self, fingerprint):
+        with self._lock:
+            future = self._futures.get(fingerprint)
+        return future is not None and _failed(future)
+
+
+def _failed(future):
+    return future.done() and future.exception() is not None
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            "Failed to build a report bundle",
+            exc_info=future.exception(),
+        )
+
+
+_builder = None
+_builder_lock = threading.Lock()
+
+
+def get_report_bundle_builder():
+    global _builder
+    if _builder is None:
+        with _builder_lock:
+            if _builder is None:
+                _builder = ReportBundleBuilder()
+    return _builder
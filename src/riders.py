@@ -0,0 +1,57 @@
+import io
+import os
+
+import pandas as pd
+
+from aggregation import Aggregation, parse_workouts_df
+from schema import normalize_workouts_df
+
+# Columns whose values are shared across riders. They are stored as categoricals
+# with one dictionary for the whole store, so joins and group-bys work on codes.
+SHARED_CATEGORIES = ["Rider", "Instructor Name", "Type"]
+
+COMPARISON_DIMENSIONS = {
+    "Instructor": "Instructor Name",
+    "Class Type": "Type",
+    "Class Length": "Length (minutes)",
+    "Year": "c_year",
+    "Month": "c_month",
+    "Week": "c_week",
+}
+
+
+def rider_name(file_name, taken):
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    candidate = name
+    suffix = 2
+    while candidate in taken:
+        candidate = "{} ({})".format(name, suffix)
+        suffix += 1
+    return candidate
+
+
+def load_riders(rider_uploads):
+    # rider_uploads is a list of (file name, csv bytes), one export per rider
+    frames = []
+    names = set()
+    for file_name, data in rider_uploads:
+        # Normalizing first turns files that aren't Peloton exports into an
+        # UnsupportedExportError before any column is read
+        workouts_df = normalize_workouts_df(pd.read_csv(io.BytesIO(data)))
+        workouts_df = workouts_df[workouts_df["Fitness Discipline"] == "Cycling"]
+        workouts_df = parse_workouts_df(workouts_df)
+
+        name = rider_name(file_name, names)
+        names.add(name)
+        workouts_df.insert(0, "Rider", name)
+        frames.append(workouts_df)
+
+    riders_df = pd.concat(frames, ignore_index=True)
+    for column in SHARED_CATEGORIES:
+        riders_df[column] = riders_df[column].astype("category")
+    return riders_df
+
+
+def compare_riders(riders_df, group_by):
+    # A single group-by over every rider at once, indexed by (rider, group)
+    return Aggregation(riders_df, ["Rider", group_by])
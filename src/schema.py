@@ -0,0 +1,126 @@
+from collections import namedtuple
+
+import pandas as pd
+
+MILES_PER_KM = 0.621371
+
+# Older Peloton exports used different names for a few columns. They are renamed to
+# the current names before anything else looks at the frame.
+COLUMN_ALIASES = {
+    "Instructor": "Instructor Name",
+    "Length": "Length (minutes)",
+    "Calories": "Calories Burned",
+    "Avg. Heart Rate": "Avg. Heartrate",
+    "Avg. Cadence": "Avg. Cadence (RPM)",
+    "Output": "Total Output",
+}
+
+REQUIRED_COLUMNS = [
+    "Workout Timestamp",
+    "Live/On-Demand",
+    "Instructor Name",
+    "Length (minutes)",
+    "Fitness Discipline",
+    "Type",
+    "Title",
+    "Total Output",
+    "Calories Burned",
+    "Avg. Heartrate",
+    "Avg. Cadence (RPM)",
+    "Avg. Resistance",
+]
+
+# The distance and speed columns for each unit system, with the factor that converts
+# them into the canonical (imperial) units
+UNIT_COLUMNS = {
+    "imperial": ("Distance (mi)", "Avg. Speed (mph)", 1.0),
+    "metric": ("Distance (km)", "Avg. Speed (kph)", MILES_PER_KM),
+}
+
+NUMERIC_COLUMNS = [
+    "Total Output",
+    "Calories Burned",
+    "Avg. Heartrate",
+    "Avg. Cadence (RPM)",
+]
+
+ExportVariant = namedtuple("ExportVariant", ["units", "renamed_columns"])
+
+
+class UnsupportedExportError(ValueError):
+    pass
+
+
+def detect_export_variant(raw_workouts_df):
+    columns = set(raw_workouts_df.columns)
+    renamed_columns = {
+        old: new
+        for old, new in COLUMN_ALIASES.items()
+        if old in columns and new not in columns
+    }
+    columns = {renamed_columns.get(column, column) for column in columns}
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise UnsupportedExportError(
+            "This doesn't look like a Peloton workouts export. Missing columns: "
+            + ", ".join(missing)
+        )
+
+    units = [
+        name
+        for name, (distance, speed, _) in UNIT_COLUMNS.items()
+        if distance in columns and speed in columns
+    ]
+    if len(units) != 1:
+        raise UnsupportedExportError(
+            "Could not tell whether this export uses miles or kilometers. Expected "
+            + "either 'Distance (mi)' and 'Avg. Speed (mph)' or 'Distance (km)' and "
+            + "'Avg. Speed (kph)'."
+        )
+
+    return ExportVariant(units=units[0], renamed_columns=renamed_columns)
+
+
+def normalize_workouts_df(raw_workouts_df):
+    # Detect the export variant once for the whole file and convert every column the
+    # aggregations read into canonical units, so they never branch per row:
+    # - "Distance (mi)" and "Avg. Speed (mph)" are always present, in imperial units
+    # - "Length (minutes)" is the nominal class length, missing for scenic rides
+    # - "c_duration" is the ridden duration in minutes, derived for scenic rides
+    # - "Avg. Resistance" is a number rather than a "45%" string
+    variant = detect_export_variant(raw_workouts_df)
+    workouts_df = raw_workouts_df.rename(columns=variant.renamed_columns)
+
+    distance_column, speed_column, factor = UNIT_COLUMNS[variant.units]
+    distance = pd.to_numeric(workouts_df[distance_column], errors="coerce") * factor
+    speed = pd.to_numeric(workouts_df[speed_column], errors="coerce") * factor
+    workouts_df = workouts_df.drop(columns=[distance_column, speed_column])
+    workouts_df["Distance (mi)"] = distance
+    workouts_df["Avg. Speed (mph)"] = speed
+
+    # Scenic rides have no class length. Depending on the export and the pandas
+    # version that is either the string "None" or an empty cell.
+    raw_length = workouts_df["Length (minutes)"]
+    length = pd.to_numeric(raw_length.mask(raw_length == "None"), errors="coerce")
+    invalid = length.isna() & raw_length.notna() & (raw_length != "None")
+    if invalid.any():
+        raise UnsupportedExportError(
+            "Unexpected values in 'Length (minutes)': "
+            + ", ".join(str(value) for value in raw_length[invalid].unique()[:5])
+        )
+    workouts_df["Length (minutes)"] = length.round().astype("Int64")
+
+    scenic = length.isna() & (speed > 0)
+    workouts_df["c_duration"] = length.astype("float64").where(
+        ~scenic, distance / speed * 60
+    )
+
+    workouts_df["Avg. Resistance"] = pd.to_numeric(
+        workouts_df["Avg. Resistance"].astype("string").str.rstrip("%"),
+        errors="coerce",
+    ).astype("float64")
+    for column in NUMERIC_COLUMNS:
+        workouts_df[column] = pd.to_numeric(workouts_df[column], errors="coerce")
+
+    return workouts_df
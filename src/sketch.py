@@ -0,0 +1,86 @@
+import math
+import random
+
+import numpy as np
+
+
+class KLLSketch(object):
+    # A mergeable quantile sketch (Karnin, Lang & Liberty, 2016). Values are kept in
+    # a stack of compactors; level h holds items of weight 2**h. When a level is
+    # over capacity it is sorted and every other item is promoted to the level
+    # above, so memory stays around 3k items no matter how many values are added.
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = random.Random(seed)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def size(self):
+        return sum(len(level) for level in self.levels)
+
+    def update(self, value):
+        self.update_many([value])
+
+    def update_many(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        qs = np.asarray(qs, dtype="float64")
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(level), 2 ** h) for h, level in enumerate(self.levels)]
+        )
+        order = np.argsort(values, kind="mergesort")
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        # The first item whose cumulative weight reaches the requested rank
+        indices = np.searchsorted(cumulative, qs * cumulative[-1], side="left")
+        return values[np.minimum(indices, len(values) - 1)]
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def _capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                level = np.sort(level)
+                # Keep one item back if the level has an odd count
+                if len(level) % 2:
+                    kept, pairs = level[:1], level[1:]
+                else:
+                    kept, pairs = level[:0], level
+                offset = self._rng.randint(0, 1)
+                promoted = pairs[offset::2]
+                self.levels[h] = kept
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
@@ -0,0 +1,271 @@
+import argparse
+import html
+import os
+import re
+from contextlib import contextmanager
+
+import plotly.io as pio
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from pandas.io.formats.style import Styler
+
+import aggregation
+import main
+from schema import UnsupportedExportError
+from streamlit_stub import StubSession, StubStreamlit, StubUploadedFile, stub_streamlit
+
+# Pages that only make sense with a live session: the upload form, the multi-file
+# rider comparison and the telemetry debug view
+SKIPPED_PAGES = ["Upload Workouts", "Compare Riders", "Page Telemetry"]
+
+# How the report gets plotly.js: inlined once into the page (self-contained), as a
+# plotly.min.js file next to the reports (shared and cached across reports) or from
+# the plotly CDN
+PLOTLYJS_MODES = ["inline", "file", "cdn"]
+PLOTLYJS_FILE_NAME = "plotly.min.js"
+
+STYLE = """
+body { font-family: sans-serif; margin: 0 auto; max-width: 1400px; padding: 1em; }
+nav a { margin-right: 1em; }
+section { border-top: 1px solid #ddd; margin-top: 2em; }
+.row { display: flex; gap: 1em; }
+.row > div { min-width: 0; }
+table { border-collapse: collapse; font-size: 0.85em; }
+td, th { padding: 0.2em 0.6em; text-align: right; }
+details { margin: 1em 0; }
+summary { cursor: pointer; font-weight: bold; }
+.error { color: #b00; }
+"""
+
+
+def markdown_to_html(text):
+    # Just the markdown the pages use: paragraphs, "- " lists, **bold** and links
+    def inline(line):
+        line = html.escape(line)
+        line = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", line)
+        return re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r'<a href="\2">\1</a>', line)
+
+    blocks = []
+    paragraph = []
+    items = []
+    for line in [line.strip() for line in text.strip().splitlines()] + [""]:
+        if line.startswith("- "):
+            items.append("<li>{}</li>".format(inline(line[2:])))
+            continue
+        if items:
+            blocks.append("<ul>{}</ul>".format("".join(items)))
+            items = []
+        if line:
+            paragraph.append(inline(line))
+        elif paragraph:
+            blocks.append("<p>{}</p>".format(" ".join(paragraph)))
+            paragraph = []
+    if paragraph:
+        blocks.append("<p>{}</p>".format(" ".join(paragraph)))
+    return "\n".join(blocks)
+
+
+class Row(object):
+    # The cells of one st.columns() call, filled in as each column is entered
+    def __init__(self, widths):
+        self.widths = widths
+        self.cells = [[] for _ in widths]
+
+    def to_html(self):
+        return '<div class="row">{}</div>'.format(
+            "".join(
+                '<div style="flex: {}">{}</div>'.format(width, join_html(cell))
+                for width, cell in zip(self.widths, self.cells)
+            )
+        )
+
+
+def join_html(parts):
+    return "\n".join(
+        part.to_html() if isinstance(part, Row) else part for part in parts
+    )
+
+
+class StaticStreamlit(StubStreamlit):
+    # Renders the elements of each page to HTML instead of sending them to a browser.
+    # Widgets keep their defaults, like in the load test.
+    def __init__(self):
+        super().__init__()
+        self.errors = []
+        self._n_figures = 0
+        self._containers = [[]]
+
+    def take(self):
+        # The HTML rendered since the last call
+        parts = self._containers[0]
+        self._containers = [[]]
+        return join_html(parts)
+
+    def _append(self, part):
+        self._containers[-1].append(part)
+
+    @contextmanager
+    def _container(self, parts):
+        self._containers.append(parts)
+        try:
+            yield
+        finally:
+            self._containers.pop()
+
+    def title(self, body):
+        self._append("<h1>{}</h1>".format(html.escape(body)))
+
+    def subheader(self, body):
+        self._append("<h3>{}</h3>".format(html.escape(body)))
+
+    def markdown(self, body):
+        self._append(markdown_to_html(body))
+
+    def error(self, body):
+        self.errors.append(body)
+        self._append('<p class="error">{}</p>'.format(html.escape(body)))
+
+    def dataframe(self, data):
+        if isinstance(data, Styler):
+            self._append(data.to_html())
+        else:
+            self._append(data.to_html(classes="dataframe"))
+
+    def plotly_chart(self, figure, use_container_width=False):
+        # Every figure draws with the single copy of plotly.js in the page head
+        self._n_figures += 1
+        self._append(
+            pio.to_html(
+                figure,
+                full_html=False,
+                include_plotlyjs=False,
+                div_id="figure-{}".format(self._n_figures),
+                config={"responsive": True},
+            )
+        )
+
+    @contextmanager
+    def expander(self, label, expanded=False):
+        parts = []
+        with self._container(parts):
+            yield
+        self._append(
+            "<details{}><summary>{}</summary>{}</details>".format(
+                " open" if expanded else "", html.escape(label), join_html(parts)
+            )
+        )
+
+    def columns(self, spec):
+        widths = [1] * spec if isinstance(spec, int) else list(spec)
+        row = Row(widths)
+        self._append(row)
+        return [self._container(cell) for cell in row.cells]
+
+
+def page_id(page):
+    return re.sub(r"[^a-z0-9]+", "-", page.lower()).strip("-")
+
+
+def plotlyjs_tag(plotlyjs):
+    if plotlyjs == "inline":
+        return "<script>{}</script>".format(get_plotlyjs())
+    if plotlyjs == "file":
+        return '<script src="{}"></script>'.format(PLOTLYJS_FILE_NAME)
+    if plotlyjs == "cdn":
+        return '<script src="https://cdn.plot.ly/plotly-{}.min.js"></script>'.format(
+            get_plotlyjs_version()
+        )
+    raise ValueError("Unknown plotly.js mode: {}".format(plotlyjs))
+
+
+def render_report(data, file_name="workouts.csv", discipline=None, plotlyjs="inline"):
+    # Processes the export with the app's own upload page, then renders every other
+    # page once against the same session, so each aggregation and figure is built a
+    # single time for the whole report
+    stub = StaticStreamlit()
+    session = StubSession(StubUploadedFile(file_name, data))
+    sections = []
+    with stub_streamlit(stub), stub.session(session):
+        main.pages["Upload Workouts"]()
+        if "workouts_pipeline" not in session.session_state:
+            raise UnsupportedExportError(
+                stub.errors[0] if stub.errors else "No workouts found"
+            )
+        if discipline is not None:
+            aggregation.select_discipline(discipline)
+        discipline = session.session_state["discipline"]
+        stub.take()
+
+        for page, render in main.pages.items():
+            if page in SKIPPED_PAGES:
+                continue
+            render()
+            sections.append((page, stub.take()))
+
+    title = "Pelotonnes: {} Stats".format(discipline)
+    return """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>{style}</style>
+{plotlyjs}
+</head>
+<body>
+<h1>{title}</h1>
+<nav>{nav}</nav>
+{sections}
+</body>
+</html>
+""".format(
+        title=html.escape(title),
+        style=STYLE,
+        plotlyjs=plotlyjs_tag(plotlyjs),
+        nav="".join(
+            '<a href="#{}">{}</a>'.format(page_id(page), html.escape(page))
+            for page, _ in sections
+        ),
+        sections="\n".join(
+            '<section id="{}">{}</section>'.format(page_id(page), body)
+            for page, body in sections
+        ),
+    )
+
+
+def write_reports(paths, out_dir, discipline=None, plotlyjs="inline"):
+    # One report per export, named after it. In "file" mode every report in out_dir
+    # shares one plotly.min.js.
+    os.makedirs(out_dir, exist_ok=True)
+    if plotlyjs == "file":
+        with open(os.path.join(out_dir, PLOTLYJS_FILE_NAME), "w") as f:
+            f.write(get_plotlyjs())
+
+    report_paths = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        report = render_report(
+            data, os.path.basename(path), discipline=discipline, plotlyjs=plotlyjs
+        )
+        report_path = os.path.join(
+            out_dir, os.path.splitext(os.path.basename(path))[0] + ".html"
+        )
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(report)
+        report_paths.append(report_path)
+    return report_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render static HTML reports of every page from workouts.csv files."
+    )
+    parser.add_argument("paths", nargs="+", help="Peloton workouts.csv exports")
+    parser.add_argument("--out-dir", default="reports")
+    parser.add_argument("--discipline", default=None)
+    parser.add_argument("--plotlyjs", choices=PLOTLYJS_MODES, default="inline")
+    args = parser.parse_args()
+
+    for report_path in write_reports(
+        args.paths, args.out_dir, args.discipline, args.plotlyjs
+    ):
+        print(report_path)
@@ -0,0 +1,149 @@
+import io
+import threading
+from contextlib import contextmanager
+
+import aggregation
+import main
+import render_activity_by_hour
+import render_compare_riders
+import render_page_telemetry
+import render_personal_records
+import render_stats_all_time
+import render_stats_by_class
+import render_stats_by_time
+from telemetry import PageTelemetry, payload_size
+
+# The modules that do `import streamlit as st` and need the stub swapped in
+STREAMLIT_MODULES = [
+    aggregation,
+    main,
+    render_activity_by_hour,
+    render_compare_riders,
+    render_page_telemetry,
+    render_personal_records,
+    render_stats_all_time,
+    render_stats_by_class,
+    render_stats_by_time,
+]
+
+
+class StubUploadedFile(io.BytesIO):
+    # Mirrors the attributes of Streamlit's UploadedFile
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+        self.type = "text/csv"
+
+
+class StubSession(object):
+    def __init__(self, uploaded_file=None):
+        self.session_state = {}
+        self.uploaded_file = uploaded_file
+        self.n_elements = 0
+        self.payload_bytes = 0
+
+
+class StubStreamlit(object):
+    # A minimal stand-in for the `streamlit` module. Every thread drives one session,
+    # and elements are serialized the way Streamlit would before sending them.
+    def __init__(self, telemetry=None):
+        self._local = threading.local()
+        self.sidebar = self
+        self.telemetry = telemetry or PageTelemetry()
+
+    @contextmanager
+    def session(self, session):
+        self._local.session = session
+        try:
+            yield session
+        finally:
+            self._local.session = None
+
+    @property
+    def _session(self):
+        return self._local.session
+
+    @property
+    def session_state(self):
+        return self._session.session_state
+
+    def _emit(self, payload, n_bytes=None):
+        self._session.n_elements += 1
+        self._session.payload_bytes += len(payload) if n_bytes is None else n_bytes
+
+    def _emit_measured(self, kind, data):
+        n_bytes = payload_size(kind, data)
+        self.telemetry.record_element(kind, n_bytes=n_bytes)
+        self._emit(None, n_bytes)
+
+    def set_page_config(self, **kwargs):
+        pass
+
+    def title(self, body):
+        self._emit(body)
+
+    def subheader(self, body):
+        self._emit(body)
+
+    def markdown(self, body):
+        self._emit(body)
+
+    def error(self, body):
+        self._emit(body)
+
+    def empty(self):
+        pass
+
+    def dataframe(self, data):
+        self._emit_measured("dataframe", data)
+
+    def plotly_chart(self, figure, use_container_width=False):
+        self._emit_measured("plotly_chart", figure)
+
+    def file_uploader(self, label, type=None, help=None, accept_multiple_files=False):
+        uploaded_file = self._session.uploaded_file
+        if uploaded_file is not None:
+            uploaded_file.seek(0)
+        if accept_multiple_files:
+            return [uploaded_file] if uploaded_file is not None else []
+        return uploaded_file
+
+    def checkbox(self, label, value=False):
+        return value
+
+    def slider(self, label, min_value=None, max_value=None, value=None):
+        return value
+
+    def radio(self, label, options):
+        return list(options)[0]
+
+    def selectbox(self, label, options, index=0, key=None):
+        options = list(options)
+        return options[index] if options else None
+
+    @contextmanager
+    def expander(self, label, expanded=False):
+        yield
+
+    def columns(self, spec):
+        n_columns = spec if isinstance(spec, int) else len(spec)
+        return [self._column() for _ in range(n_columns)]
+
+    @contextmanager
+    def _column(self):
+        yield
+
+
+@contextmanager
+def stub_streamlit(stub=None):
+    # Swap the stub into every page module for the duration of the block
+    stub = stub or StubStreamlit()
+    originals = [module.st for module in STREAMLIT_MODULES]
+    for module in STREAMLIT_MODULES:
+        module.st = stub
+    try:
+        yield stub
+    finally:
+        for module, original in zip(STREAMLIT_MODULES, originals):
+            module.st = original
@@ -0,0 +1,113 @@
+import datetime
+import io
+import random
+
+import pandas as pd
+
+INSTRUCTORS = [
+    "Alex Toussaint",
+    "Ally Love",
+    "Ben Alldis",
+    "Christine D'Ercole",
+    "Cody Rigsby",
+    "Denis Morton",
+    "Emma Lovewell",
+    "Hannah Frankson",
+    "Jess King",
+    "Kendall Toole",
+    "Leanne Hainsby",
+    "Matt Wilpers",
+    "Olivia Amato",
+    "Robin Arzón",
+    "Sam Yo",
+    "Tunde Oyeneyin",
+]
+CLASS_TYPES = [
+    "Climb",
+    "Intervals",
+    "Low Impact",
+    "Music",
+    "Power Zone",
+    "Theme",
+    "Warm Up/Cool Down",
+]
+CLASS_LENGTHS = [5, 10, 15, 20, 30, 45, 60]
+OTHER_DISCIPLINES = ["Strength", "Stretching", "Running", "Yoga"]
+
+
+def make_workouts_df(n_workouts=1000, seed=0, metric=False, years=3.0):
+    # Builds a frame shaped like a Peloton workouts.csv export. Most rows are cycling
+    # classes, with a few scenic rides and other disciplines mixed in.
+    rng = random.Random(seed)
+    end = datetime.datetime(2022, 1, 1, 7, 0)
+    span_minutes = int(years * 365 * 24 * 60)
+    timestamps = sorted(
+        end - datetime.timedelta(minutes=rng.randrange(span_minutes))
+        for _ in range(n_workouts)
+    )
+
+    rows = []
+    for timestamp in timestamps:
+        discipline = "Cycling"
+        if rng.random() < 0.1:
+            discipline = rng.choice(OTHER_DISCIPLINES)
+        scenic = discipline == "Cycling" and rng.random() < 0.05
+
+        length = rng.choice(CLASS_LENGTHS)
+        cadence = rng.gauss(85, 8)
+        resistance = rng.gauss(42, 6)
+        output_per_minute = max(2.0, rng.gauss(9, 2))
+        speed = max(5.0, rng.gauss(19, 2))
+        distance = speed * length / 60.0
+        heartrate = rng.gauss(140, 12) if rng.random() < 0.7 else None
+
+        row = {
+            "Workout Timestamp": timestamp.strftime("%Y-%m-%d %H:%M (-05)"),
+            "Live/On-Demand": "Live" if rng.random() < 0.2 else "On Demand",
+            "Instructor Name": None if scenic else rng.choice(INSTRUCTORS),
+            "Length (minutes)": "None" if scenic else length,
+            "Fitness Discipline": discipline,
+            "Type": "Scenic" if scenic else rng.choice(CLASS_TYPES),
+            "Title": "{} min Ride".format(length),
+            "Class Timestamp": timestamp.strftime("%Y-%m-%d %H:%M (-05)"),
+            "Total Output": None,
+            "Avg. Watts": None,
+            "Avg. Resistance": None,
+            "Avg. Cadence (RPM)": None,
+            "Avg. Speed (mph)": None,
+            "Distance (mi)": None,
+            "Calories Burned": rng.randint(5, 15) * length,
+            "Avg. Heartrate": heartrate,
+        }
+        if discipline == "Cycling":
+            row.update(
+                {
+                    "Total Output": round(output_per_minute * length),
+                    "Avg. Watts": round(output_per_minute * 100.0 / 6.0),
+                    "Avg. Resistance": "{:.0f}%".format(resistance),
+                    "Avg. Cadence (RPM)": round(cadence),
+                    "Avg. Speed (mph)": round(speed, 2),
+                    "Distance (mi)": round(distance, 2),
+                }
+            )
+        rows.append(row)
+
+    workouts_df = pd.DataFrame(rows)
+    if metric:
+        workouts_df["Avg. Speed (mph)"] = workouts_df["Avg. Speed (mph)"] / 0.621371
+        workouts_df["Distance (mi)"] = workouts_df["Distance (mi)"] / 0.621371
+        workouts_df = workouts_df.rename(
+            columns={
+                "Avg. Speed (mph)": "Avg. Speed (kph)",
+                "Distance (mi)": "Distance (km)",
+            }
+        )
+    return workouts_df
+
+
+def make_workouts_csv(n_workouts=1000, seed=0, metric=False, years=3.0):
+    buffer = io.StringIO()
+    make_workouts_df(n_workouts, seed=seed, metric=metric, years=years).to_csv(
+        buffer, index=False
+    )
+    return buffer.getvalue().encode("utf-8")
@@ -0,0 +1,291 @@
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+import pyarrow as pa
+from pandas.io.formats.style import Styler
+
+# Deployments turn page telemetry on with environment variables, e.g.
+#   PELOTONNES_TELEMETRY=on PELOTONNES_TELEMETRY_SAMPLE_RATE=0.1
+# Measuring a page serializes its charts and frames a second time, so it is off by
+# default and should be sampled on busy deployments.
+TELEMETRY_ENV = "PELOTONNES_TELEMETRY"
+TELEMETRY_SAMPLE_RATE_ENV = "PELOTONNES_TELEMETRY_SAMPLE_RATE"
+PAYLOAD_BUDGET_ENV = "PELOTONNES_PAYLOAD_BUDGET_BYTES"
+
+# The bytes a single page render may send to the browser before it is logged as over
+# budget. Pages without an entry use the default.
+DEFAULT_PAYLOAD_BUDGET = 2 * 1024 * 1024
+PAYLOAD_BUDGETS = {
+    "Upload Workouts": 4 * 1024 * 1024,
+    "About": 64 * 1024,
+}
+
+# Log a summary of every page after this many measured renders
+LOG_SUMMARY_EVERY = 100
+
+MEASURED_ELEMENTS = ["plotly_chart", "dataframe"]
+
+logger = logging.getLogger("pelotonnes.telemetry")
+
+
+def payload_size(kind, data):
+    # The size of an element as Streamlit would serialize it: plotly figures as JSON,
+    # frames as Arrow IPC, and a Styler as its rendered cells
+    if kind == "plotly_chart":
+        return len(data.to_json())
+    if isinstance(data, Styler):
+        return len(data.to_html())
+    if not isinstance(data, pd.DataFrame):
+        data = pd.DataFrame(data)
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(data)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+def log2_bounds(low, high):
+    bounds = [low]
+    while bounds[-1] < high:
+        bounds.append(bounds[-1] * 2)
+    return bounds
+
+
+class Histogram(object):
+    # Counts per bucket, where bucket i holds values up to bounds[i] and the last
+    # bucket holds everything larger. Quantiles are reported as bucket upper bounds.
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.n += 1
+        self.total += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else float("nan")
+
+    def quantile(self, q):
+        if self.n == 0:
+            return float("nan")
+        rank = q * self.n
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_series(self):
+        labels = ["<= {:g}".format(bound) for bound in self.bounds]
+        labels.append("> {:g}".format(self.bounds[-1]))
+        return pd.Series(self.counts, index=labels)
+
+
+class PageStats(object):
+    def __init__(self, page):
+        self.page = page
+        self.budget = payload_budget(page)
+        self.payload_bytes = Histogram(log2_bounds(1024, 64 * 1024 * 1024))
+        self.n_elements = Histogram(log2_bounds(1, 256))
+        self.render_ms = Histogram(log2_bounds(1, 16384))
+        self.element_bytes = defaultdict(lambda: 0)
+        self.n_over_budget = 0
+
+    def add(self, render):
+        self.payload_bytes.add(render["payload_bytes"])
+        self.n_elements.add(render["n_elements"])
+        self.render_ms.add(render["render_ms"])
+        for kind, n_bytes in render["element_bytes"].items():
+            self.element_bytes[kind] += n_bytes
+        if render["payload_bytes"] > self.budget:
+            self.n_over_budget += 1
+
+    def summary(self):
+        return {
+            "Page": self.page,
+            "Renders": self.payload_bytes.n,
+            "Payload p50 (KB)": self.payload_bytes.quantile(0.5) / 1024.0,
+            "Payload p95 (KB)": self.payload_bytes.quantile(0.95) / 1024.0,
+            "Payload max (KB)": self.payload_bytes.max / 1024.0,
+            "Budget (KB)": self.budget / 1024.0,
+            "Over budget": self.n_over_budget,
+            "Elements p50": self.n_elements.quantile(0.5),
+            "Render p50 (ms)": self.render_ms.quantile(0.5),
+            "Render p95 (ms)": self.render_ms.quantile(0.95),
+        }
+
+
+def payload_budget(page):
+    if page in PAYLOAD_BUDGETS:
+        return PAYLOAD_BUDGETS[page]
+    return int(os.environ.get(PAYLOAD_BUDGET_ENV, DEFAULT_PAYLOAD_BUDGET))
+
+
+class PageTelemetry(object):
+    # Per-page histograms of payload size, element count and server-side render time,
+    # shared by every session in the process
+    def __init__(self, sample_rate=1.0, log_summary_every=LOG_SUMMARY_EVERY):
+        self.sample_rate = sample_rate
+        self.log_summary_every = log_summary_every
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._n_renders = 0
+
+    @property
+    def enabled(self):
+        return True
+
+    @contextmanager
+    def measure(self, page):
+        # Times the page and collects the elements it sends. The yielded dict is
+        # filled in when the block exits, so callers can copy it into other events.
+        render = {}
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            yield render
+            return
+
+        self._local.elements = []
+        self._local.overhead = 0.0
+        start = time.perf_counter()
+        try:
+            yield render
+        finally:
+            elapsed = time.perf_counter() - start
+            elements = self._local.elements
+            self._local.elements = None
+
+            element_bytes = defaultdict(lambda: 0)
+            for kind, n_bytes in elements:
+                element_bytes[kind] += n_bytes
+            render.update(
+                page=page,
+                n_elements=len(elements),
+                payload_bytes=sum(element_bytes.values()),
+                element_bytes=dict(element_bytes),
+                # Leave out the time spent measuring the elements themselves
+                render_ms=(elapsed - self._local.overhead) * 1000.0,
+            )
+            self.record(render)
+
+    def record_element(self, kind, data=None, n_bytes=None):
+        # Called for every measured element; a no-op outside of measure()
+        elements = getattr(self._local, "elements", None)
+        if elements is None:
+            return
+        if n_bytes is None:
+            start = time.perf_counter()
+            n_bytes = payload_size(kind, data)
+            self._local.overhead += time.perf_counter() - start
+        elements.append((kind, n_bytes))
+
+    def record(self, render):
+        page = render["page"]
+        with self._lock:
+            stats = self._pages.get(page)
+            if stats is None:
+                stats = PageStats(page)
+                self._pages[page] = stats
+            stats.add(render)
+            self._n_renders += 1
+            log_summary = self._n_renders % self.log_summary_every == 0
+
+        if render["payload_bytes"] > stats.budget:
+            logger.warning(
+                "%s sent %d bytes in %d elements, over its %d byte budget",
+                page,
+                render["payload_bytes"],
+                render["n_elements"],
+                stats.budget,
+            )
+        if log_summary:
+            logger.info("Page telemetry:\n%s", self.summary_df().to_string())
+
+    def pages(self):
+        with self._lock:
+            return dict(self._pages)
+
+    def summary_df(self):
+        with self._lock:
+            summaries = [stats.summary() for stats in self._pages.values()]
+        if not summaries:
+            return pd.DataFrame()
+        return pd.DataFrame(summaries).set_index("Page")
+
+
+class DisabledTelemetry(object):
+    @property
+    def enabled(self):
+        return False
+
+    @contextmanager
+    def measure(self, page):
+        yield {}
+
+    def record_element(self, kind, data=None, n_bytes=None):
+        pass
+
+    def pages(self):
+        return {}
+
+
+def make_telemetry(mode=None, sample_rate=None):
+    mode = (mode or os.environ.get(TELEMETRY_ENV, "off")).lower()
+    if sample_rate is None:
+        sample_rate = float(os.environ.get(TELEMETRY_SAMPLE_RATE_ENV, "1.0"))
+
+    if mode in ("off", "none", "disabled", "0"):
+        return DisabledTelemetry()
+    if mode in ("on", "1"):
+        return PageTelemetry(sample_rate=sample_rate)
+    raise ValueError("Unknown telemetry mode: {}".format(mode))
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = make_telemetry()
+    return _telemetry
+
+
+def instrument_streamlit(st):
+    # Wrap st.plotly_chart and st.dataframe once per process so every page's elements
+    # are reported to the telemetry in use at call time. Outside of a measured render
+    # the wrappers only forward the call.
+    with _telemetry_lock:
+        for kind in MEASURED_ELEMENTS:
+            original = getattr(st, kind)
+            if getattr(original, "_pelotonnes_instrumented", False):
+                continue
+            setattr(st, kind, _measured(kind, original))
+
+
+def _measured(kind, original):
+    @wraps(original)
+    def element(data, *args, **kwargs):
+        get_telemetry().record_element(kind, data)
+        return original(data, *args, **kwargs)
+
+    element._pelotonnes_instrumented = True
+    return element